@@ -0,0 +1,5 @@
+from cmorph.runner import STAGES
+from cmorph.runner import run
+from cmorph.runner import run_sweep
+from cmorph.batch import run_batch
+from cmorph.batch import run_stack
@@ -0,0 +1,93 @@
+import sys
+import argparse
+import cmorph
+
+# ANSI color codes
+RED = "\033[91m"
+RESET = "\033[0m"
+
+# guard: workers of the process executor backend import the main module
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="cmorph")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser(
+        "run", help="run the stages of a survey in a single process"
+    )
+    run_parser.add_argument("survey", help="survey folder (base path of the stages)")
+    batch_parser = commands.add_parser(
+        "batch", help="run the stages of all surveys of a folder in parallel"
+    )
+    batch_parser.add_argument("root", help="folder of the survey folders (e.g. demo)")
+    batch_parser.add_argument(
+        "--template",
+        help="folder of the {stage}_config.json templates of all surveys",
+    )
+    batch_parser.add_argument(
+        "--workers", type=int, help="surveys run at once (default: auto)"
+    )
+    batch_parser.add_argument("--cpus", type=int, help="CPU budget (default: auto)")
+    batch_parser.add_argument(
+        "--memory", type=int, help="memory budget in MB (default: auto)"
+    )
+    stack_parser = commands.add_parser(
+        "stack", help="sample profiles of all surveys of a folder from their DEM stack"
+    )
+    stack_parser.add_argument("root", help="folder of the survey folders (e.g. demo)")
+    stack_parser.add_argument(
+        "--template",
+        help="folder of the {stage}_config.json templates of all surveys",
+    )
+    sweep_parser = commands.add_parser(
+        "sweep", help="search the profiles of a survey with a grid of finder parameters"
+    )
+    sweep_parser.add_argument("survey", help="survey folder (base path of the stages)")
+    sweep_parser.add_argument(
+        "--template",
+        help="folder of the {stage}_config.json templates of the survey",
+    )
+    for command_parser in [run_parser, batch_parser]:
+        command_parser.add_argument(
+            "--stages",
+            default=",".join(cmorph.STAGES),
+            help=f"comma separated stages (default: {','.join(cmorph.STAGES)})",
+        )
+        command_parser.add_argument(
+            "--no-export",
+            action="store_true",
+            help="keep results in memory, write only the database",
+        )
+    args = parser.parse_args()
+
+    try:
+        if args.command == "stack":
+            stack = cmorph.run_stack(args.root, args.template)
+            print(
+                f"... elevation {stack['elevation'].shape} (transect x epoch x sample) "
+                f"of {', '.join(stack['epochs'])}"
+            )
+            sys.exit(0)
+
+        if args.command == "sweep":
+            _, summary = cmorph.run_sweep(args.survey, args.template)
+            print(summary.to_string(index=False))
+            sys.exit(0)
+
+        stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+        if args.command == "run":
+            cmorph.run(args.survey, stages, export=not args.no_export)
+        else:
+            summary = cmorph.run_batch(
+                args.root,
+                stages,
+                export=not args.no_export,
+                template_path=args.template,
+                workers=args.workers,
+                cpus=args.cpus,
+                memory=args.memory,
+            )
+            print(summary.to_string(index=False))
+            if (summary.status != "ok").any():
+                sys.exit(1)
+    except Exception as e:
+        print(f"{RED}{type(e)}: {e}{RESET}")
+        sys.exit(1)
@@ -0,0 +1,185 @@
+import glob
+import time
+import traceback
+import numpy as np
+import concurrent.futures
+import pandas as pd
+from contextlib import redirect_stdout, redirect_stderr
+from natsort import natsorted
+from os import listdir, makedirs
+from os.path import join, isdir, abspath, basename
+from tqdm import tqdm
+from cmorph.runner import STAGES, run, load_config
+from pgen import sample_stack
+from shared.resources import get_cpus, get_memory
+
+# folder of the survey logs and the summary table (in the root folder)
+BATCH_FOLDER = "batch"
+SUMMARY_FILE = "summary.csv"
+STACK_FILE = "stack.npz"
+
+# ANSI color codes
+YELLOW = "\033[93m"
+RESET = "\033[0m"
+
+
+def find_surveys(root_path):
+    """Survey folders (with an input folder) directly under the root, in natural order"""
+    return natsorted(
+        join(root_path, name)
+        for name in listdir(root_path)
+        if isdir(join(root_path, name, "input"))
+    )
+
+
+def split_budget(surveys, workers=None, cpus=None, memory=None):
+    """Surveys run at once and the CPU and memory budget of each of them
+
+    All CPUs are shared by the surveys, the CPUs of a survey are used by the
+    workers of its parallel stages.
+    """
+    cpus = get_cpus() if cpus is None else int(cpus)
+    memory = get_memory() if memory is None else int(memory)
+    workers = max(min(len(surveys), cpus), 1) if workers is None else int(workers)
+    return workers, {
+        "cpus": max(cpus // workers, 1),
+        "memory": max(memory // workers, 1),
+    }
+
+
+def run_survey(survey_path, stages, export, template_path, resources, log_file):
+    """Run the stages of the survey (in a worker process), output goes to the log file
+
+    Returns the summary row of the survey.
+    """
+    summary = {"survey": basename(survey_path), "status": "ok"}
+    start = time.perf_counter()
+    with open(log_file, "w") as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            outputs = run(survey_path, stages, export, template_path, resources)
+            for key in ["profiles", "finder", "analyzer"]:
+                if key in outputs:
+                    summary[key] = (
+                        outputs[key].groupby(["no_transect", "dem"]).ngroups
+                        if key == "profiles" and len(outputs[key])
+                        else len(outputs[key])
+                    )
+            if "lines" in outputs:
+                summary["lines"] = len(outputs["lines"])
+        except Exception as e:
+            traceback.print_exc()
+            summary["status"] = "error"
+            summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = round(time.perf_counter() - start, 1)
+    summary["log"] = log_file
+    return summary
+
+
+def run_batch(
+    root_path,
+    stages=STAGES,
+    export=True,
+    template_path=None,
+    workers=None,
+    cpus=None,
+    memory=None,
+):
+    """Run the stages of all surveys of the root folder on a process pool
+
+    Every survey writes its own log, the summary table (one row per survey) is
+    written to the batch folder and returned.
+    """
+    root_path = abspath(root_path)
+    template_path = abspath(template_path) if template_path is not None else None
+    surveys = find_surveys(root_path)
+    if not surveys:
+        raise Exception(f"... no survey folders (with input folder) in {root_path}.")
+
+    batch_path = join(root_path, BATCH_FOLDER)
+    makedirs(batch_path, exist_ok=True)
+    workers, resources = split_budget(surveys, workers, cpus, memory)
+    print(
+        f"{YELLOW}... {len(surveys)} surveys, {workers} at once, "
+        f"{resources['cpus']} CPUs and {resources['memory']} MB each{RESET}"
+    )
+
+    summaries = []
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(
+                    run_survey,
+                    survey_path,
+                    stages,
+                    export,
+                    template_path,
+                    resources,
+                    join(batch_path, f"{basename(survey_path)}.log"),
+                )
+                for survey_path in surveys
+            ]
+            for future in tqdm(
+                concurrent.futures.as_completed(futures),
+                total=len(futures),
+                desc="... surveys",
+            ):
+                summaries.append(future.result())
+
+        summary = pd.DataFrame(summaries)
+        summary["survey"] = pd.Categorical(
+            summary["survey"], [basename(survey) for survey in surveys], ordered=True
+        )
+        summary = summary.sort_values("survey", ignore_index=True)
+        summary.to_csv(join(batch_path, SUMMARY_FILE), index=False)
+
+    except Exception as e:
+        print("... run_batch function error")
+        raise e
+
+    return summary
+
+
+def run_stack(root_path, template_path=None):
+    """Profiles of all surveys of the root folder sampled from the stack of their DEMs
+
+    Transects of the first survey are used (the same for all surveys sharing
+    the site transect cache), the arrays (see pgen.sample_stack) are written
+    to the batch folder and returned.
+    """
+    root_path = abspath(root_path)
+    template_path = abspath(template_path) if template_path is not None else None
+
+    epochs, names = [], []
+    for survey_path in find_surveys(root_path):
+        config = load_config(survey_path, "generator", template_path)
+        dem_files = natsorted(
+            glob.glob(join(survey_path, config["paths"]["input"]["dem"], "*.tif"))
+        )
+        if dem_files:
+            epochs.append(dem_files)
+            names.append(basename(survey_path))
+    if not epochs:
+        raise Exception(f"... no survey folders with DEM files in {root_path}.")
+
+    # transects and sampling parameters of the first survey
+    config = load_config(join(root_path, names[0]), "generator", template_path)
+    parameters = config["parameters"]
+    try:
+        stack = sample_stack(
+            epochs,
+            join(config["paths"]["base"], config["paths"]["db"]),
+            config["db_layers"]["transects"],
+            parameters["profile_resolution"],
+            parameters.get("sampling_method", "nearest"),
+            parameters.get("executor", "thread"),
+            config.get("resources", {}),
+            names,
+        )
+        makedirs(join(root_path, BATCH_FOLDER), exist_ok=True)
+        np.savez_compressed(join(root_path, BATCH_FOLDER, STACK_FILE), **stack)
+
+    except Exception as e:
+        print("... run_stack function error")
+        raise e
+
+    return stack
@@ -0,0 +1,235 @@
+import sys
+import json
+import geopandas as gpd
+from os import makedirs
+from os.path import join, exists, dirname, abspath
+
+TOOLS_PATH = join(dirname(dirname(abspath(__file__))), "tools")
+
+# tool packages (pgen, finder, analyzer) and their shared modules are imported
+# from the tool folders
+for tool in ["generator-py", "finder-py", "analyzer-py", "shared-py"]:
+    if join(TOOLS_PATH, tool) not in sys.path:
+        sys.path.insert(0, join(TOOLS_PATH, tool))
+
+import pgen
+from finder.search import load_profiles as load_finder_profiles, search_profiles
+from finder.search import get_frame_chunks, iter_frame_batches, prepare_batch
+from finder.search import get_search_hash, export_results as export_finder_results
+from finder.sweep import load_sweep_profiles, sweep_profiles, export_sweep
+from shared.store import iter_profiles
+from shared.lines import create_line_from_points
+from analyzer.analyze import (
+    POINT_LAYERS,
+    get_points_distance,
+    load_points,
+    load_profiles as load_analyzer_profiles,
+    analyze_profiles,
+    get_point_layers,
+    get_analysis_hash,
+    export_results as export_analyzer_results,
+)
+
+# stages of a survey in order, every stage uses the results of the previous one
+STAGES = ["generator", "finder", "analyzer", "lines"]
+
+# ANSI color codes
+YELLOW = "\033[93m"
+RESET = "\033[0m"
+
+
+def load_config(survey_path, stage, template_path=None):
+    """Config of the stage: {stage}_config.json of the template folder or of the
+    survey, config.json of the tool otherwise
+
+    The base path is the survey folder.
+    """
+    config_file = join(survey_path, f"{stage}_config.json")
+    if template_path is not None and exists(
+        join(template_path, f"{stage}_config.json")
+    ):
+        config_file = join(template_path, f"{stage}_config.json")
+    elif not exists(config_file):
+        config_file = join(TOOLS_PATH, f"{stage}-py", "config.json")
+    with open(config_file, "r") as jsonfile:
+        config = json.load(jsonfile)
+    config["paths"]["base"] = survey_path
+    return config
+
+
+def select_profiles(profiles, profile_ids):
+    """Selected in-memory profiles and their count"""
+    if profile_ids:
+        profiles = profiles[profiles.no_transect.isin(profile_ids)]
+    return profiles, profiles.groupby(["no_transect", "dem"]).ngroups
+
+
+def run_generator(config, export=True):
+    """Transects and profiles of the survey, the (cropped) profiles are returned
+
+    All generator stages are rebuilt, profile files are written only with export
+    (the database is written anyway).
+    """
+    if not export:
+        config["parameters"]["profile_formats"] = []
+    hashes = pgen.get_stage_hashes(config)
+    stale = pgen.get_stale_stages(config, hashes, force=True)
+
+    print(f"{YELLOW}... initializing data structures{RESET}")
+    pgen.init(config, stale)
+
+    print(f"{YELLOW}... generating transects{RESET}")
+    pgen.generate_transects(config)
+    pgen.update_manifest(config, "transects", hashes["transects"])
+
+    memory_sink = pgen.MemorySink()
+    if config["parameters"].get("pipeline", False):
+        print(f"{YELLOW}... generating profiles (pipelined){RESET}")
+        pgen.generate_pipeline(config, memory_sink=memory_sink)
+    else:
+        print(f"{YELLOW}... preparing cropped DEM rasters{RESET}")
+        windows = pgen.get_DEM(config)
+        try:
+            print(f"{YELLOW}... generating profiles{RESET}")
+            pgen.generate_profiles(config, windows, memory_sink=memory_sink)
+        finally:
+            pgen.release_windows(windows)
+    pgen.update_manifest(config, "dem", hashes["dem"])
+    pgen.update_manifest(config, "profiles", hashes["profiles"])
+
+    return memory_sink.get_profiles()
+
+
+def run_finder(config, profiles=None, export=True):
+    """Zero, base and top points of the profiles (read from disk without profiles)"""
+    if profiles is None:
+        profile_chunks, profiles_count = load_finder_profiles(config)
+    else:
+        profiles, profiles_count = select_profiles(profiles, config["selected_profiles"])
+        profile_chunks = get_frame_chunks(profiles)
+
+    print(f"{YELLOW}... looking for the base and top of profiles{RESET}")
+    results = search_profiles(config, profile_chunks, profiles_count)
+
+    if export:
+        print(f"{YELLOW}... exporting CSV data{RESET}")
+        export_finder_results(config, results, get_search_hash(config))
+    return results
+
+
+def run_sweep(survey_path, template_path=None, profiles=None, export=True):
+    """Finder parameter sweep of the survey (see finder.sweep), profiles are read
+    from disk once without profiles
+
+    Returns the results of all combinations and their summary.
+    """
+    config = load_config(abspath(survey_path), "finder", template_path)
+    if profiles is None:
+        batches, profiles_count = load_sweep_profiles(config)
+    else:
+        profiles, profiles_count = select_profiles(profiles, config["selected_profiles"])
+        batches = [prepare_batch(*batch) for batch in iter_frame_batches(profiles)]
+
+    print(f"{YELLOW}... sweeping the finder parameters{RESET}")
+    results, summary = sweep_profiles(config, batches, profiles_count)
+
+    if export:
+        print(f"{YELLOW}... exporting CSV data{RESET}")
+        export_sweep(config, results, summary)
+    return results, summary
+
+
+def run_analyzer(config, points=None, profiles=None, export=True):
+    """Profile properties and their point layers (inputs read from disk when missing)"""
+    base = config["paths"]["base"]
+    points_distance = get_points_distance(join(base, config["paths"]["db"]))
+    if points is None:
+        points = load_points(config)
+    if profiles is None:
+        profile_items, profiles_count = load_analyzer_profiles(config)
+    else:
+        profiles, profiles_count = select_profiles(profiles, config["selected_profiles"])
+        profile_items = iter_profiles(profiles)
+
+    print(f"{YELLOW}... calculation of profile properties{RESET}")
+    results = analyze_profiles(
+        config, points, profile_items, profiles_count, points_distance
+    )
+    layers = get_point_layers(results, config["shape"]["crs"])
+
+    if export:
+        print(f"{YELLOW}... exporting profile properties and SHP data{RESET}")
+        export_analyzer_results(config, results, layers, get_analysis_hash(config))
+    return results, layers
+
+
+def run_lines(survey_path, layers=None, export=True):
+    """Lines along the point layers of the analyzer (read from the SHP files without layers)"""
+    if layers is None:
+        shapes_path = join(survey_path, "output", "analyser", "shapes")
+        layers = {
+            name: gpd.read_file(join(shapes_path, name, f"{name}.shp"))
+            for name in POINT_LAYERS
+            if exists(join(shapes_path, name, f"{name}.shp"))
+        }
+
+    lines = {
+        name: gpd.GeoDataFrame(geometry=[create_line_from_points(points)], crs=points.crs)
+        for name, points in layers.items()
+        if len(points) > 1
+    }
+
+    if export:
+        print(f"{YELLOW}... exporting lines{RESET}")
+        lines_path = join(survey_path, "output", "lines")
+        makedirs(lines_path, exist_ok=True)
+        for name, line in lines.items():
+            line.to_file(join(lines_path, f"{name}Line.geojson"), driver="GeoJSON")
+    return lines
+
+
+def run(survey_path, stages=STAGES, export=True, template_path=None, resources=None):
+    """Run the stages of the survey in a single process
+
+    Profiles, finder results and analyzer results are handed between the stages
+    in memory, stages missing from the run read the outputs of a previous run
+    from disk. Without export only the database is written. Configs are read
+    from the template folder when given, resources override the CPU and memory
+    budget of the generator and the finder. Returns the results of the stages
+    (profiles, finder, analyzer, layers, lines).
+    """
+    survey_path = abspath(survey_path)
+    for stage in stages:
+        if stage not in STAGES:
+            raise Exception(f"... unknown stage ({stage}), use some of {STAGES}.")
+
+    outputs = {}
+    try:
+        if "generator" in stages:
+            config = load_config(survey_path, "generator", template_path)
+            if resources is not None:
+                config["resources"] = {**config.get("resources", {}), **resources}
+            outputs["profiles"] = run_generator(config, export)
+
+        if "finder" in stages:
+            config = load_config(survey_path, "finder", template_path)
+            if resources is not None:
+                config["resources"] = {**config.get("resources", {}), **resources}
+            outputs["finder"] = run_finder(config, outputs.get("profiles"), export)
+
+        if "analyzer" in stages:
+            outputs["analyzer"], outputs["layers"] = run_analyzer(
+                load_config(survey_path, "analyzer", template_path),
+                outputs.get("finder"),
+                outputs.get("profiles"),
+                export,
+            )
+
+        if "lines" in stages:
+            outputs["lines"] = run_lines(survey_path, outputs.get("layers"), export)
+
+    except Exception as e:
+        print("... run function error")
+        raise e
+
+    return outputs
@@ -81,6 +81,13 @@ def finder_ui():
         st.subheader("Paths")
         config["paths"]["base"] = st.text_input("Base Path", value=config["paths"]["base"])
         config["paths"]["input"]["profiles"] = st.text_input("Input Profiles Path", value=config["paths"]["input"]["profiles"])
+        profiles_store = st.text_input(
+            "Input Profiles Store Path (empty = CSV files)", value=config["paths"]["input"].get("profiles_store", "")
+        )
+        if profiles_store:
+            config["paths"]["input"]["profiles_store"] = profiles_store
+        else:
+            config["paths"]["input"].pop("profiles_store", None)
         config["paths"]["output"]["results"] = st.text_area(
             "Output Results Paths (one per line)", value="\n".join(config["paths"]["output"]["results"])
         ).splitlines()
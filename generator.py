@@ -142,6 +142,45 @@ def generator_ui():
     config["parameters"]["buffer_width"] = st.number_input(
         "Buffer Width (m)", value=config["parameters"].get("buffer_width", 10)
     )
+    sampling_methods = ["nearest", "bilinear", "cubic"]
+    config["parameters"]["sampling_method"] = st.selectbox(
+        "Sampling Method",
+        sampling_methods,
+        index=sampling_methods.index(config["parameters"].get("sampling_method", "nearest"))
+    )
+    slope_methods = ["raster", "profile"]
+    config["parameters"]["slope_method"] = st.selectbox(
+        "Slope Method",
+        slope_methods,
+        index=slope_methods.index(config["parameters"].get("slope_method", "raster"))
+    )
+    config["parameters"]["dem_mosaic"] = st.checkbox(
+        "DEM Tiles Mosaic",
+        value=config["parameters"].get("dem_mosaic", False)
+    )
+    config["parameters"]["profile_formats"] = st.multiselect(
+        "Profile Formats",
+        ["csv", "parquet"],
+        default=config["parameters"].get("profile_formats", ["csv"])
+    )
+    config["parameters"]["export_dem_rasters"] = st.checkbox(
+        "Export Cropped DEM Rasters",
+        value=config["parameters"].get("export_dem_rasters", False)
+    )
+    executors = ["thread", "process", "serial"]
+    config["parameters"]["executor"] = st.selectbox(
+        "Executor",
+        executors,
+        index=executors.index(config["parameters"].get("executor", "thread"))
+    )
+    config["parameters"]["pipeline"] = st.checkbox(
+        "Pipelined Stages",
+        value=config["parameters"].get("pipeline", False)
+    )
+    resources = config.setdefault("resources", {})
+    for key, label in [("cpus", "CPU Budget (auto or cores)"), ("memory", "Memory Budget (auto or MB)")]:
+        value = st.text_input(label, value=str(resources.get(key, "auto")))
+        resources[key] = int(value) if value.strip().isdigit() else "auto"
 
     if st.button("Save Configuration"):
         save_config(config)
@@ -1,12 +1,17 @@
 import os
+import sys
 import json
 import geopandas as gpd
 import streamlit as st
 import folium
 from folium.plugins import Fullscreen
-from shapely.geometry import LineString
 from streamlit_folium import st_folium
 
+# modules shared by the tools (line of the point layers)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tools", "shared-py"))
+
+from shared.lines import create_line_from_points
+
 CONFIG_PATH = "tools/lines-py/config.json"
 
 def load_config():
@@ -30,10 +35,6 @@ def load_points_from_shp(file_path):
         st.error(f"File loading error {file_path}: {e}")
         return None
 
-def create_line_from_points(points_gdf):
-    points_sorted = points_gdf.sort_values(by=['profile_id', 'point_id'])
-    return LineString(points_sorted.geometry.tolist())
-
 def process_lines(input_folder, output_folder, selected_layers):
     required_folders = ["output", "analyser", "shapes"]
     full_path = os.path.join(resolve_path(input_folder), "output", "analyser", "shapes")
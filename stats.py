@@ -154,6 +154,21 @@ def load_origins(base_folder, selected_folders, line_name):
         else:
             date_str = "unknown_date"
 
+        store_path = os.path.join(base_folder, folder, "output", "generator", "profiles", "store", "cropped")
+        if os.path.exists(store_path):
+            # read only the origin points from the profile store
+            try:
+                df = pd.read_parquet(
+                    store_path,
+                    columns=["no_transect", "no_point", "x_geo", "y_geo"],
+                    filters=[("no_point", "==", 0)],
+                )
+                for row in df.drop_duplicates("no_transect").itertuples():
+                    origins.setdefault(int(row.no_transect), {})[folder] = (row.x_geo, row.y_geo)
+                continue
+            except Exception as e:
+                st.warning(f"Error reading origins from {store_path}: {e}")
+
         cropped_path = os.path.join(base_folder, folder, "output", "generator", "profiles", "cropped")
         if not os.path.exists(cropped_path):
             continue
@@ -0,0 +1,235 @@
+import glob
+import shutil
+from natsort import natsorted
+import pandas as pd
+import geopandas as gpd
+import numpy as np
+from os import makedirs
+from os.path import join, basename, normpath, dirname
+from tqdm import tqdm
+from analyzer.measure import get_volume, get_distance, get_slope
+from shared.store import read_profiles, iter_profiles, iter_csv_profiles
+from shared.manifest import get_stage_hash, update_manifest
+from shared.writer import AsyncWriter
+
+# point layers of the analyzer results: layer => (prefix of the result columns, extra columns)
+POINT_LAYERS = {
+    "bottomPoints": ("bottom", ["method"]),
+    "topPoints": ("top", ["method"]),
+    "firstZeroPoints": ("first_zero", []),
+    "lastZeroPoints": ("last_zero", []),
+}
+
+
+def get_points_distance(db_file):
+    """Distance between transects => profiles width"""
+    points = gpd.read_file(db_file, layer="points")
+    return round(points.iloc[0].geometry.distance(points.iloc[1].geometry), 3)
+
+
+def load_points(config):
+    """Bottom and top points of the finder CSV files"""
+    csv_points = config["csv"]["points"]
+    points_input_path = join(
+        config["paths"]["base"], config["paths"]["input"]["points"]
+    )
+    points_first_file = join(
+        points_input_path, csv_points["first"]
+    )  # main file if more fils
+
+    point_files = natsorted(glob.glob(f"{points_input_path}/*.csv"))  # todo
+    points = pd.read_csv(
+        points_first_file,
+        encoding="utf-8",
+        sep=csv_points["sep"],
+        skipinitialspace=True,  # todo
+    )
+    point_files.remove(points_first_file)
+    for file in point_files:
+        next_points = pd.read_csv(
+            file,
+            encoding="utf-8",
+            sep=csv_points["sep"],
+            skipinitialspace=True,
+            names=csv_points["colnames"],
+        )
+        points = pd.concat([points, next_points])
+    return points
+
+
+def load_profiles(config):
+    """(profile_id, profile) pairs of the profile store or CSV files and their count"""
+    profiles_input_path = join(
+        config["paths"]["base"], config["paths"]["input"]["profiles"]
+    )
+
+    # all or selected profiles?
+    selected = True if len(config["selected_profiles"]) > 0 else False
+
+    if "profiles_store" in config["paths"]["input"]:
+        # read only the columns used by the analyzer from the profile store
+        profiles = read_profiles(
+            join(config["paths"]["base"], config["paths"]["input"]["profiles_store"]),
+            columns=["no_point", "elevation", "x_geo", "y_geo"],
+            survey=basename(normpath(config["paths"]["base"])),
+            profile_ids=config["selected_profiles"] if selected else None,
+        )
+        profiles_count = profiles.groupby(["no_transect", "dem"]).ngroups
+        profile_items = iter_profiles(profiles)
+    else:
+        # list profile files
+        profile_files = natsorted(glob.glob(f"{profiles_input_path}/*.csv"))  # todo
+        profiles_count = len(profile_files)
+        profile_items = iter_csv_profiles(
+            profile_files,
+            config["csv"]["profiles"]["sep"],
+            profile_ids=config["selected_profiles"] if selected else None,
+        )
+
+    return profile_items, profiles_count
+
+
+def analyze_profiles(config, points, profile_items, profiles_count, points_distance):
+    """Beach and dune properties of the profiles between the finder points"""
+    points = points.dropna(subset=["bottom", "top"])  # remove rows with NaN bottom & top
+
+    results = []
+    with tqdm(total=profiles_count, desc=f"... all profiles") as pbar:
+        for profile_id, csv in profile_items:
+            pbar.update(1)
+
+            # select points by profile id
+            profile_points = points[points.profile_id == profile_id]
+            correct_points = pd.DataFrame()
+            for method in config["methods_order"]:
+                tmp_points = profile_points[profile_points.method == method]
+                if len(tmp_points):
+                    correct_points = pd.concat([correct_points, tmp_points])
+                    break
+            method = -1
+
+            if len(correct_points) == 0:
+                continue
+            else:
+                top_id = int(correct_points.iloc[0].top)
+                bottom_id = int(correct_points.iloc[0].bottom)
+                first_zero_id = int(correct_points.iloc[0].first_zero)
+                last_zero_id = int(correct_points.iloc[0].last_zero)
+
+            bottom = csv[csv.no_point == bottom_id]
+            top = csv[csv.no_point == top_id]
+            first_zero = csv[csv.no_point == first_zero_id]
+            last_zero = csv[csv.no_point == last_zero_id]
+
+            result = {
+                "profile_id": profile_id,
+                "method": correct_points.iloc[0].method,
+                "first_zero_id": first_zero_id,
+                "last_zero_id": last_zero_id,
+                "bottom_id": bottom_id,
+                "top_id": top_id,
+                "first_zero_x": (
+                    first_zero.x_geo.values[0] if len(first_zero) > 0 else np.nan
+                ),
+                "first_zero_y": (
+                    first_zero.y_geo.values[0] if len(first_zero) > 0 else np.nan
+                ),
+                "first_zero_elevation": (
+                    first_zero.elevation.values[0] if len(first_zero) > 0 else np.nan
+                ),
+                "last_zero_x": (
+                    last_zero.x_geo.values[0] if len(last_zero) > 0 else np.nan
+                ),
+                "last_zero_y": (
+                    last_zero.y_geo.values[0] if len(last_zero) > 0 else np.nan
+                ),
+                "last_zero_elevation": (
+                    last_zero.elevation.values[0] if len(last_zero) > 0 else np.nan
+                ),
+                "bottom_x": bottom.x_geo.values[0] if len(bottom) > 0 else np.nan,
+                "bottom_y": bottom.y_geo.values[0] if len(bottom) > 0 else np.nan,
+                "bottom_elevation": (
+                    bottom.elevation.values[0] if len(bottom) > 0 else np.nan
+                ),
+                "top_x": top.x_geo.values[0] if len(top) > 0 else np.nan,
+                "top_y": top.y_geo.values[0] if len(top) > 0 else np.nan,
+                "top_elevation": top.elevation.values[0] if len(top) > 0 else np.nan,
+                "beach_width": get_distance(csv, first_zero_id, bottom_id),
+                "beach_slope": get_slope(csv, first_zero_id, bottom_id),
+                "beach_volume": get_volume(
+                    points_distance, csv, first_zero_id, bottom_id, True
+                ),
+                "dune_width": get_distance(csv, bottom_id, top_id),
+                "dune_slope": get_slope(csv, bottom_id, top_id),
+                "dune_volume": get_volume(
+                    points_distance, csv, bottom_id, top_id, True
+                ),
+            }
+            results.append(result)
+
+    # one row per profile (each with index 0, as the measurement CSV was written)
+    return pd.DataFrame(results, index=[0] * len(results))
+
+
+def get_point_layers(results, crs):
+    """GeoDataFrames of the bottom, top and zero points of the analyzer results"""
+    layers = {}
+    for name, (prefix, columns) in POINT_LAYERS.items():
+        points = gpd.GeoDataFrame(
+            results[["profile_id", f"{prefix}_id"] + columns + [f"{prefix}_elevation"]],
+            geometry=gpd.points_from_xy(results[f"{prefix}_x"], results[f"{prefix}_y"]),
+        )
+        points.rename(
+            columns={f"{prefix}_elevation": "elevation", f"{prefix}_id": "point_id"},
+            inplace=True,
+        )
+        layers[name] = points.set_crs(crs=crs)
+    return layers
+
+
+def get_output_paths(config):
+    """Measurement CSV file and folder of the SHP point layers"""
+    return (
+        join(
+            config["paths"]["base"],
+            config["paths"]["output"]["finall"],
+            config["csv"]["output"]["first"],
+        ),
+        join(config["paths"]["base"], config["paths"]["output"]["shapes"]),
+    )
+
+
+def get_analysis_hash(config):
+    """Stage hash of the analysis: the config, the finder points, the database and the profiles"""
+    profiles_input = (
+        config["paths"]["input"]["profiles_store"]
+        if "profiles_store" in config["paths"]["input"]
+        else config["paths"]["input"]["profiles"]
+    )
+    return get_stage_hash(
+        config,
+        [
+            join(config["paths"]["base"], config["paths"]["input"]["points"]),
+            join(config["paths"]["base"], config["paths"]["db"]),
+            join(config["paths"]["base"], profiles_input),
+        ],
+    )
+
+
+def export_results(config, results, layers, stage_hash):
+    """Write the measurement CSV file and the SHP point layers, record the stage in the manifest"""
+    measurement_file, shapes_output_path = get_output_paths(config)
+    makedirs(dirname(measurement_file), exist_ok=True)
+    makedirs(shapes_output_path, exist_ok=True)
+
+    # Ensure clean SHP output directories
+    for name in POINT_LAYERS:
+        shutil.rmtree(join(shapes_output_path, name), ignore_errors=True)
+
+    # outputs are written in the background, the barrier is the end of the block
+    with AsyncWriter(threads=4) as writer:
+        writer.submit(results.to_csv, measurement_file, sep=config["csv"]["output"]["sep"])
+        for name, layer in layers.items():
+            writer.submit(layer.to_file, join(shapes_output_path, name))
+
+    update_manifest(config, "analyzer", stage_hash)
@@ -1,7 +1,11 @@
 from finder.smooth import smooth_profile
 from finder.smooth import smooth_points
+from finder.smooth import smooth_profiles_batch
 from finder.shape import get_zero_points
 from finder.shape import method_2
+from finder.shape import get_sections_len
+from finder.shape import get_zero_points_batch
+from finder.shape import method_2_batch
 
 
 def get_main_points(
@@ -20,3 +24,26 @@ def get_main_points(
             min_profile_points=min_profile_points,
         )
     return retVal
+
+
+def get_main_points_batch(
+    elevation,
+    offsets,
+    section_len,
+    begin_no,
+    end_no,
+    method=2,
+    min_profile_points=20,
+):
+    """get_main_points of the concatenated profiles (profile i is offsets[i]:offsets[i + 1])"""
+    retVal = None
+    if method == 2:
+        retVal = method_2_batch(
+            elevation,
+            offsets,
+            section_len,
+            begin_no,
+            end_no,
+            min_profile_points=min_profile_points,
+        )
+    return retVal
@@ -0,0 +1,172 @@
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from finder.shape import get_zero_points, method_2, get_sections_len
+from finder.shape import get_zero_points_batch, method_2_batch
+from finder.smooth import smooth_profile, smooth_profiles_batch
+
+# Equivalence check of the batch kernels (get_zero_points_batch, method_2_batch,
+# smooth_profiles_batch) and the functions of a single profile (get_zero_points,
+# method_2, smooth_profile) on random profiles, run from the finder folder:
+# python -m finder.check [--seed N]
+
+
+def get_random_profiles(rng, profiles_count, max_points=200):
+    """Concatenated random profiles (random walk around zero) and their ranges
+
+    Elevations are rounded to centimetres, as in the profile files, so equal
+    elevations (ties of the points) are frequent. Returns elevation, x_geo,
+    y_geo, offsets and begin_no, end_no of the profiles, ranges cover short,
+    empty and too long (invalid) ones too.
+    """
+    lengths = rng.integers(1, max_points, profiles_count)
+    offsets = np.cumsum(np.concatenate([[0], lengths])).astype(np.int64)
+    elevation = np.concatenate(
+        [
+            (rng.normal(0.3, 1, length).cumsum() + rng.uniform(-10, 2)) * rng.uniform(0.1, 1)
+            for length in lengths
+        ]
+    ).round(2)
+    x_geo = np.concatenate([np.arange(length) * rng.uniform(0.5, 2) for length in lengths])
+    y_geo = np.concatenate([np.arange(length) * rng.uniform(0.5, 2) for length in lengths])
+    begin_no = np.array([rng.integers(0, length) for length in lengths])
+    end_no = np.array(
+        [rng.integers(begin, length + 2) for begin, length in zip(begin_no, lengths)]
+    )
+    return elevation, x_geo, y_geo, offsets, begin_no, end_no
+
+
+def get_profile_points(function, *args, **kwargs):
+    """Points of a single profile function, None for the profiles it cannot process"""
+    try:
+        return function(*args, **kwargs)
+    except (IndexError, KeyError):
+        return None
+
+
+def check_batch(profiles_count=2000, seed=0, elevation_zero=0, min_profile_points=20):
+    """Profiles of which the batch kernels differ from the single profile functions"""
+    rng = np.random.default_rng(seed)
+    elevation, x_geo, y_geo, offsets, begin_no, end_no = get_random_profiles(
+        rng, profiles_count
+    )
+    section_len = get_sections_len(x_geo, y_geo, offsets)
+    zero_points = get_zero_points_batch(
+        elevation, offsets, begin_no, end_no, elevation_zero, min_profile_points
+    )
+    main_points = method_2_batch(
+        elevation, offsets, section_len, begin_no, end_no, min_profile_points
+    )
+
+    mismatches = []
+    for idx in range(profiles_count):
+        profile = pd.DataFrame(
+            {
+                "x_geo": x_geo[offsets[idx] : offsets[idx + 1]],
+                "y_geo": y_geo[offsets[idx] : offsets[idx + 1]],
+                "elevation": elevation[offsets[idx] : offsets[idx + 1]],
+            }
+        )
+        zero = get_profile_points(
+            get_zero_points,
+            profile,
+            begin_no[idx],
+            end_no[idx],
+            elevation_zero,
+            min_profile_points=min_profile_points,
+        )
+        if zero is None or zero["first"] is None:
+            expected = (-1, -1)
+        else:
+            expected = (zero["first"], zero["last"])
+        if expected != (zero_points["first"][idx], zero_points["last"][idx]):
+            mismatches.append(("get_zero_points", idx))
+
+        main = get_profile_points(
+            method_2,
+            profile,
+            begin_no[idx],
+            end_no[idx],
+            min_profile_points=min_profile_points,
+        )
+        if main is None or main["bottom"] is None:
+            expected = (-1, -1)
+        else:
+            expected = (main["bottom"], main["top"])
+        if expected != (main_points["bottom"][idx], main_points["top"][idx]):
+            mismatches.append(("method_2", idx))
+    return mismatches
+
+
+def check_smooth(profiles_count=2000, seed=0, window=9, min_profile_points=20):
+    """Profiles of which the smoothed batch search differs from smooth_profile and method_2
+
+    Smoothed elevations must be equal to the last bit: the points of equal
+    (smoothed) elevations are picked by their order only.
+    """
+    rng = np.random.default_rng(seed)
+    elevation, x_geo, y_geo, offsets, begin_no, end_no = get_random_profiles(
+        rng, profiles_count
+    )
+    section_len = get_sections_len(x_geo, y_geo, offsets)
+    smoothed_elevation, smoothed = smooth_profiles_batch(
+        elevation, offsets, begin_no, end_no, window=window
+    )
+    main_points = method_2_batch(
+        smoothed_elevation, offsets, section_len, begin_no, end_no, min_profile_points
+    )
+
+    mismatches = []
+    for idx in range(profiles_count):
+        profile = pd.DataFrame(
+            {
+                "x_geo": x_geo[offsets[idx] : offsets[idx + 1]],
+                "y_geo": y_geo[offsets[idx] : offsets[idx + 1]],
+                "elevation": elevation[offsets[idx] : offsets[idx + 1]],
+            }
+        )
+        smooth = smooth_profile(profile, begin_no[idx], end_no[idx], window)
+        if (smooth is not None) != smoothed[idx]:
+            mismatches.append(("smooth_profile", idx))
+            continue
+        if smooth is None:
+            continue
+        profile.loc[begin_no[idx] : end_no[idx] - 1, "elevation"] = smooth
+        if not np.array_equal(
+            profile["elevation"].to_numpy(),
+            smoothed_elevation[offsets[idx] : offsets[idx + 1]],
+            equal_nan=True,
+        ):
+            mismatches.append(("smooth_profile", idx))
+            continue
+
+        main = get_profile_points(
+            method_2,
+            profile,
+            begin_no[idx],
+            end_no[idx],
+            min_profile_points=min_profile_points,
+        )
+        if main is None or main["bottom"] is None:
+            expected = (-1, -1)
+        else:
+            expected = (main["bottom"], main["top"])
+        if expected != (main_points["bottom"][idx], main_points["top"][idx]):
+            mismatches.append(("method_2 (smoothed)", idx))
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m finder.check")
+    parser.add_argument("--profiles", type=int, default=2000, help="number of random profiles")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random profiles")
+    options = parser.parse_args()
+
+    mismatches = check_batch(options.profiles, options.seed) + check_smooth(
+        options.profiles, options.seed
+    )
+    for function, idx in mismatches[:20]:
+        print(f"... {function} differs from the batch kernel (profile {idx})")
+    print(f"... {len(mismatches)} mismatches in {options.profiles} profiles (seed {options.seed})")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,11 @@
+from shared.resources import get_cpus
+
+
+def get_workers(resources, tasks):
+    """Workers of the process pool: the CPU budget (cpus, "auto" or missing for
+    all CPUs of the process) or a fixed number of workers, at most one per task"""
+    cpus = resources.get("cpus")
+    cpus = get_cpus() if cpus is None or cpus == "auto" else int(cpus)
+    workers = resources.get("workers")
+    workers = cpus if workers is None or workers == "auto" else int(workers)
+    return max(min(workers, tasks), 1)
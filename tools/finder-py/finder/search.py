@@ -0,0 +1,321 @@
+import re
+import glob
+import numpy as np
+import pandas as pd
+import concurrent.futures
+from itertools import islice
+from natsort import natsorted
+from os import makedirs
+from os.path import join, basename, normpath, dirname
+from tqdm import tqdm
+from finder import smooth_profiles_batch, get_main_points_batch
+from finder import get_sections_len, get_zero_points_batch
+from finder.shape import segments_first, segments_last, segments_argmin
+from shared.store import read_profiles, iter_csv_profiles
+from finder.resources import get_workers
+from shared.manifest import get_stage_hash, update_manifest
+from shared.writer import AsyncWriter
+
+# profiles searched at once (concatenated arrays of the batch kernels)
+SEARCH_BATCH = 1000
+
+# profiles of a task of the process pool
+CHUNK_SIZE = 500
+
+
+def load_profiles(config):
+    """Chunks of profiles (see search_profiles) of the profile store or CSV files and their count
+
+    Profiles are selected (selected_profiles) before any file is read.
+    """
+    if "profiles_store" in config["paths"]["input"]:
+        profiles = read_store_profiles(config)
+        profiles_count = profiles.groupby(["no_transect", "dem"]).ngroups
+        profile_chunks = get_frame_chunks(profiles)
+    else:
+        profile_files = list_profile_files(config)
+        profiles_count = len(profile_files)
+        profile_chunks = get_file_chunks(profile_files)
+
+    return profile_chunks, profiles_count
+
+
+def read_store_profiles(config):
+    """(Selected) profiles of the profile store, only the columns used by the finder"""
+    # all or selected profiles?
+    selected = True if len(config["selected_profiles"]) > 0 else False
+
+    return read_profiles(
+        join(config["paths"]["base"], config["paths"]["input"]["profiles_store"]),
+        columns=["id", "no_point", "elevation", "x_geo", "y_geo"],
+        survey=basename(normpath(config["paths"]["base"])),
+        profile_ids=config["selected_profiles"] if selected else None,
+    )
+
+
+def list_profile_files(config):
+    """(Selected) profile CSV files in natural order"""
+    profile_input_path = join(
+        config["paths"]["base"], config["paths"]["input"]["profiles"]
+    )
+
+    # all or selected profiles?
+    selected = True if len(config["selected_profiles"]) > 0 else False
+
+    return select_profile_files(
+        natsorted(glob.glob(f"{profile_input_path}/*.csv")),
+        config["selected_profiles"] if selected else None,
+    )
+
+
+def select_profile_files(profile_files, profile_ids=None):
+    """Profile files of the selected profiles (by the profile number of the file name)"""
+    if profile_ids is None:
+        return profile_files
+    profile_ids = set(profile_ids)
+    return [
+        name
+        for name in profile_files
+        if int(re.findall(r"\d{1,4}", basename(name))[0]) in profile_ids
+    ]
+
+
+def get_file_chunks(profile_files, chunk_size=CHUNK_SIZE):
+    """Chunks (see search_profiles) of the profile files, read by the workers"""
+    return [
+        (
+            len(profile_files[i : i + chunk_size]),
+            search_files,
+            (profile_files[i : i + chunk_size],),
+        )
+        for i in range(0, len(profile_files), chunk_size)
+    ]
+
+
+def get_frame_chunks(profiles, chunk_size=CHUNK_SIZE):
+    """Chunks (see search_profiles) of the profiles of a single frame (see iter_frame_batches)"""
+    return [
+        (len(profile_ids), search_batch, (profile_ids, batch, offsets))
+        for profile_ids, batch, offsets in iter_frame_batches(profiles, chunk_size)
+    ]
+
+
+def iter_batches(profile_items, batch_size=SEARCH_BATCH):
+    """(profile_ids, profiles, offsets) batches of (profile_id, profile) pairs,
+    profile i of the concatenated profiles is offsets[i]:offsets[i + 1]"""
+    items = (item for item in profile_items if len(item[1]) > 0)
+    while batch := list(islice(items, batch_size)):
+        yield (
+            [profile_id for profile_id, _ in batch],
+            pd.concat([profile for _, profile in batch], ignore_index=True),
+            np.cumsum([0] + [len(profile) for _, profile in batch], dtype=np.int64),
+        )
+
+
+def iter_frame_batches(profiles, batch_size=SEARCH_BATCH):
+    """Batches (see iter_batches) of the profiles of a single frame sorted by
+    no_transect, dem and no_point (e.g. read from the profile store)"""
+    sizes = profiles.groupby(["no_transect", "dem"], sort=False).size()
+    profile_ids = sizes.index.get_level_values("no_transect").astype(int).tolist()
+    bounds = np.cumsum([0] + sizes.tolist(), dtype=np.int64)
+    for i in range(0, len(sizes), batch_size):
+        j = min(i + batch_size, len(sizes))
+        yield (
+            profile_ids[i:j],
+            profiles.iloc[bounds[i] : bounds[j]].reset_index(drop=True),
+            bounds[i : j + 1] - bounds[i],
+        )
+
+
+def prepare_batch(profile_ids, profiles, offsets):
+    """Arrays of a batch of concatenated profiles (see iter_batches) searched by
+    search_prepared, independent of the finder parameters"""
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    elevation = profiles["elevation"].to_numpy(dtype=np.float64, copy=True)
+    no_point = profiles["no_point"].to_numpy()
+    cut = profiles["id"].to_numpy() > 0
+
+    # first and last point of the profiles (cut)
+    first_cut = segments_first(cut, starts, lengths)
+    last_cut = segments_last(cut, starts, lengths)
+
+    return {
+        "profile_ids": profile_ids,
+        "offsets": offsets,
+        "elevation": elevation,
+        "found": first_cut >= 0,
+        "first_no": no_point[starts + np.maximum(first_cut, 0)].astype(np.int64),
+        "last_point": no_point[starts + np.maximum(last_cut, 0)].astype(np.int64),
+        # the highest point (cut)
+        "highest_point": segments_argmin(
+            -np.where(cut & ~np.isnan(elevation), elevation, -np.inf), starts, lengths
+        ),
+        "section_len": get_sections_len(
+            profiles["x_geo"].to_numpy(dtype=np.float64),
+            profiles["y_geo"].to_numpy(dtype=np.float64),
+            offsets,
+        ),
+    }
+
+
+def search_prepared(config, batch):
+    """Zero, base and top points of a prepared batch of profiles (see prepare_batch)
+
+    The batch is not changed, so it can be searched with other parameters.
+    """
+    method = config["method"]
+    elevation_zero = config["elevation_zero"]
+    min_profile_points = config["min_profile_points"]
+    smooth = config["smoothness"]["profile"]
+    window = config["smoothness"]["window"] if "window" in config["smoothness"] else 9
+
+    offsets = batch["offsets"]
+    elevation = batch["elevation"]
+
+    # the buffer beyond the highest point
+    buffer = config["beyond_top_buffer"] if method == 2 else 0
+    last_no = np.minimum(batch["highest_point"] + buffer, batch["last_point"])
+
+    zero_result = get_zero_points_batch(
+        elevation,
+        offsets,
+        batch["first_no"],
+        last_no,
+        elevation_zero,
+        min_profile_points=min_profile_points,
+    )
+    valid = batch["found"] & zero_result["valid"]
+    first_no = np.maximum(batch["first_no"], zero_result["last"])
+
+    if smooth:
+        # the ranges of the valid profiles only (others are not searched)
+        elevation, smoothed = smooth_profiles_batch(
+            elevation,
+            offsets,
+            np.where(valid, first_no, 0),
+            np.where(valid, last_no, 0),
+            window=window,
+        )
+        valid &= smoothed
+
+    result = get_main_points_batch(
+        elevation,
+        offsets,
+        batch["section_len"],
+        first_no,
+        last_no,
+        method=method,
+        min_profile_points=min_profile_points,
+    )
+
+    return [
+        {
+            "profile_id": batch["profile_ids"][idx],
+            "method": method,
+            "profile_smooth": smooth,
+            "first_zero": int(zero_result["first"][idx]),
+            "last_zero": int(zero_result["last"][idx]),
+            "bottom": int(result["bottom"][idx]) if result["valid"][idx] else None,
+            "top": int(result["top"][idx]) if result["valid"][idx] else None,
+        }
+        for idx in np.flatnonzero(valid)
+    ]
+
+
+def search_batch(config, profile_ids, profiles, offsets):
+    """Zero, base and top points of a batch of concatenated profiles
+
+    Points are found for all profiles of the batch at once (see the batch
+    kernels of finder.shape), only smoothing is done profile by profile.
+    Profiles without enough points or points above zero are skipped.
+    """
+    return search_prepared(config, prepare_batch(profile_ids, profiles, offsets))
+
+
+def search_files(config, profile_files):
+    """Zero, base and top points of the profiles of the CSV files (see search_batch)"""
+    results = []
+    for profile_ids, profiles, offsets in iter_batches(
+        iter_csv_profiles(profile_files, config["csv"]["sep"])
+    ):
+        results.extend(search_batch(config, profile_ids, profiles, offsets))
+    return results
+
+
+def iter_chunk_results(config, profile_chunks, workers):
+    """(chunk index, chunk size, results) of the chunks as they are finished"""
+    if workers == 1:
+        # a single chunk or CPU: search in the calling process
+        for idx, (size, search, args) in enumerate(profile_chunks):
+            yield idx, size, search(config, *args)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = {
+            executor.submit(search, config, *args): (idx, size)
+            for idx, (size, search, args) in enumerate(profile_chunks)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            idx, size = futures[future]
+            yield idx, size, future.result()
+
+
+def search_profiles(config, profile_chunks, profiles_count, is_gui=False):
+    """Zero, base and top points of the chunks of profiles
+
+    profile_chunks: (size, search, args) of every chunk (see get_file_chunks and
+    get_frame_chunks), search(config, *args) returns the results of the chunk.
+    Chunks are searched by a pool of worker processes (resources of the config)
+    and the results are merged in profile order.
+    """
+    resources = config["resources"] if "resources" in config else {}
+    workers = get_workers(resources, len(profile_chunks))
+
+    # results of the chunks in profile order
+    chunk_results = [None] * len(profile_chunks)
+    done = 0
+
+    with tqdm(total=profiles_count, desc="... all profiles", disable=is_gui) as progress:
+        for idx, size, results in iter_chunk_results(config, profile_chunks, workers):
+            chunk_results[idx] = results
+            progress.update(size)
+            done += size
+            if is_gui:
+                print(f"... processing profile {done}/{profiles_count}")
+
+    return pd.DataFrame([result for results in chunk_results for result in results])
+
+
+def get_results_files(config):
+    """Finder result CSV file/files (the results are written to every file)"""
+    output = config["paths"]["output"]["results"]
+    return [
+        join(config["paths"]["base"], file)
+        for file in (output if isinstance(output, list) else [output])
+    ]
+
+
+def get_search_hash(config):
+    """Stage hash of the search: the config (but the CPU budget and the sweep) and the profiles"""
+    profiles_input = (
+        config["paths"]["input"]["profiles_store"]
+        if "profiles_store" in config["paths"]["input"]
+        else config["paths"]["input"]["profiles"]
+    )
+    return get_stage_hash(
+        {key: value for key, value in config.items() if key not in ["resources", "sweep"]},
+        [join(config["paths"]["base"], profiles_input)],
+    )
+
+
+def export_results(config, results, stage_hash):
+    """Write the results to the result CSV file/files and record the stage in the manifest"""
+    output_files = get_results_files(config)
+    with AsyncWriter(threads=max(len(output_files), 1)) as writer:
+        for file in output_files:
+            makedirs(dirname(file), exist_ok=True)
+            writer.submit(
+                results.to_csv, file, sep=config["csv"]["sep"], index=False, encoding="utf-8"
+            )
+    update_manifest(config, "finder", stage_hash)
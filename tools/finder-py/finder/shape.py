@@ -85,3 +85,147 @@ def method_2(profile, begin_no, end_no, min_profile_points=20):
         )
 
     return retVal
+
+
+def get_sections_len(x_geo, y_geo, offsets):
+    """get_profile_section_len of the concatenated profiles (profile i is
+    offsets[i]:offsets[i + 1]), NaN for profiles of a single point"""
+    first = offsets[:-1]
+    second = np.minimum(first + 1, len(x_geo) - 1)
+    section_len = np.round(
+        ((x_geo[second] - x_geo[first]) ** 2 + (y_geo[second] - y_geo[first]) ** 2)
+        ** (0.5),
+        3,
+    )
+    return np.where(np.diff(offsets) > 1, section_len, np.nan)
+
+
+def get_segments(profile_offsets, begin_no, end_no):
+    """Positions of the [begin_no, end_no) ranges of the profiles in the
+    concatenated arrays, starts and lengths of the ranges gathered one after another"""
+    lengths = end_no - begin_no
+    starts = np.cumsum(np.concatenate([[0], lengths[:-1]]), dtype=np.int64)
+    positions = np.repeat(profile_offsets + begin_no - starts, lengths)
+    return positions + np.arange(lengths.sum()), starts, lengths
+
+
+def segments_first(mask, starts, lengths):
+    """First True of every segment (relative to its start), -1 if none"""
+    hits = np.flatnonzero(mask)
+    if len(hits) == 0:
+        return np.full(len(starts), -1, dtype=np.int64)
+    hit = hits[np.minimum(np.searchsorted(hits, starts), len(hits) - 1)]
+    return np.where((hit >= starts) & (hit < starts + lengths), hit - starts, -1)
+
+
+def segments_last(mask, starts, lengths):
+    """Last True of every segment (relative to its start), -1 if none"""
+    hits = np.flatnonzero(mask)
+    if len(hits) == 0:
+        return np.full(len(starts), -1, dtype=np.int64)
+    hit = hits[np.maximum(np.searchsorted(hits, starts + lengths) - 1, 0)]
+    return np.where((hit >= starts) & (hit < starts + lengths), hit - starts, -1)
+
+
+def segments_argmin(values, starts, lengths):
+    """First minimum of every (non-empty) segment, NaN first (as np.argmin)"""
+    key = np.where(np.isnan(values), -np.inf, values)
+    minima = np.minimum.reduceat(key, starts)
+    return segments_first(key == np.repeat(minima, lengths), starts, lengths)
+
+
+def get_zero_points_batch(
+    elevation, offsets, begin_no, end_no, elevation_zero, min_profile_points=20
+):
+    """get_zero_points of the concatenated profiles (see get_sections_len)
+
+    Returns arrays of the first and the last zero points (-1 when not found)
+    and of the valid profiles (long enough, with points above zero).
+    """
+    begin_no = np.asarray(begin_no, dtype=np.int64)
+    end_no = np.asarray(end_no, dtype=np.int64)
+    first = np.full(len(begin_no), -1, dtype=np.int64)
+    last = np.full(len(begin_no), -1, dtype=np.int64)
+
+    valid = (
+        (begin_no < end_no)
+        & (np.diff(offsets) >= end_no)
+        & (end_no - begin_no >= min_profile_points)
+    )
+    index = np.flatnonzero(valid)
+    if len(index) == 0:
+        return {"first": first, "last": last, "valid": valid}
+
+    begin = begin_no[index]
+    positions, starts, lengths = get_segments(offsets[index], begin, end_no[index])
+    values = elevation[positions]
+    below = values <= elevation_zero
+
+    # any zero or lower values?
+    last_below = segments_last(below, starts, lengths)
+    first_above = segments_first(values > elevation_zero, starts, lengths)
+    any_below = last_below >= 0
+    first[index] = np.where(any_below, begin + first_above, begin)
+    last[index] = np.where(any_below, begin + last_below + 1, begin)
+
+    # only zero or lower values
+    nothing_above = index[any_below & (first_above < 0)]
+    first[nothing_above] = -1
+    last[nothing_above] = -1
+    valid[nothing_above] = False
+    return {"first": first, "last": last, "valid": valid}
+
+
+def method_2_batch(
+    elevation, offsets, section_len, begin_no, end_no, min_profile_points=20
+):
+    """method_2 of the concatenated profiles (see get_sections_len)
+
+    Distances of the points of all profiles to their chords are computed at
+    once. Returns arrays of the bottom and the top points (-1 when not found)
+    and of the valid profiles.
+    """
+    begin_no = np.asarray(begin_no, dtype=np.int64)
+    end_no = np.asarray(end_no, dtype=np.int64)
+    bottom = np.full(len(begin_no), -1, dtype=np.int64)
+    top = np.full(len(begin_no), -1, dtype=np.int64)
+
+    valid = (
+        (begin_no < end_no)
+        & (np.diff(offsets) > end_no)
+        & (end_no - begin_no >= min_profile_points)
+    )
+    index = np.flatnonzero(valid)
+    if len(index) == 0:
+        return {"bottom": bottom, "top": top, "valid": valid}
+
+    offset = offsets[index]
+    sl = section_len[index]
+    begin = begin_no[index]
+    end = end_no[index]
+
+    # a = (he - hb) / (de - db), b = hb - (he - hb) / (de - db) * db
+    hb = elevation[offset + begin]
+    he = elevation[offset + end]
+    a = (he - hb) / (end * sl - begin * sl)
+    b = hb - (he - hb) / (end * sl - begin * sl) * begin * sl
+
+    # Di = (-a * di + h1 - b) / (a**2 + 1)**(0.5) of the points begin..end
+    positions, starts, lengths = get_segments(offset, begin, end + 1)
+    a = np.repeat(a, lengths)
+    idx = positions - np.repeat(offset, lengths)
+    D = ((-a) * idx * np.repeat(sl, lengths) + elevation[positions] - np.repeat(b, lengths)) / (
+        a**2 + 1
+    ) ** (0.5)
+
+    D_min_index = segments_argmin(D, starts, lengths)
+
+    # the top is the maximum beyond the bottom
+    top_positions, top_starts, top_lengths = get_segments(
+        starts, D_min_index, lengths
+    )
+    D_max_index = segments_argmin(-D[top_positions], top_starts, top_lengths)
+
+    bottom[index] = begin + D_min_index
+    top[index] = begin + D_min_index + D_max_index
+    return {"bottom": bottom, "top": top, "valid": valid}
@@ -1,4 +1,5 @@
 from scipy.signal import savgol_filter
+import numpy as np
 import pandas as pd
 
 def smooth_profile(profile, begin_no, end_no, window=9, degree=3):
@@ -8,6 +9,30 @@ def smooth_profile(profile, begin_no, end_no, window=9, degree=3):
     except:
         return None
 
+def smooth_profiles_batch(elevation, offsets, begin_no, end_no, window=9, degree=3):
+    """smooth_profile of the [begin_no, end_no) ranges of the concatenated profiles
+    (profile i is offsets[i]:offsets[i + 1])
+
+    Every range is filtered by savgol_filter on its own: the smoothed elevations
+    are equal to those of smooth_profile to the last bit, so points of equal
+    elevation are picked as by the search of a single profile. Returns the
+    smoothed elevation (a copy) and the smoothed profiles (False where
+    smooth_profile fails, e.g. ranges shorter than the window).
+    """
+    elevation = elevation.copy()
+    smoothed = np.zeros(len(begin_no), dtype=bool)
+    for idx in np.flatnonzero(np.asarray(end_no) > np.asarray(begin_no)):
+        profile = elevation[offsets[idx] : offsets[idx + 1]]
+        try:
+            profile[begin_no[idx] : end_no[idx]] = savgol_filter(
+                profile[begin_no[idx] : end_no[idx]], window, degree
+            )
+        except:
+            continue
+        smoothed[idx] = True
+    return elevation, smoothed
+
+
 def smooth_points(points):
     try:
         return points.mask(points.sub(points.mean()).div(points.std()).abs().gt(1))
@@ -0,0 +1,157 @@
+import itertools
+import pandas as pd
+from os import makedirs
+from os.path import join, dirname
+from tqdm import tqdm
+from shared.store import iter_csv_profiles
+from shared.writer import AsyncWriter
+from finder.search import read_store_profiles, list_profile_files
+from finder.search import iter_batches, iter_frame_batches
+from finder.search import prepare_batch, search_prepared
+
+# parameters of the sweep, smooth_window is the Savitzky-Golay window
+# (null for profiles without smoothing)
+SWEEP_PARAMETERS = [
+    "elevation_zero",
+    "min_profile_points",
+    "beyond_top_buffer",
+    "smooth_window",
+]
+
+
+def get_combinations(config):
+    """Combinations (grid) of the values of the sweep parameters
+
+    Parameters missing from the sweep section of the config keep the value of
+    the config.
+    """
+    sweep = config["sweep"] if "sweep" in config else {}
+    smoothness = config["smoothness"]
+    defaults = {
+        "elevation_zero": config["elevation_zero"],
+        "min_profile_points": config["min_profile_points"],
+        "beyond_top_buffer": config["beyond_top_buffer"],
+        "smooth_window": (
+            (smoothness["window"] if "window" in smoothness else 9)
+            if smoothness["profile"]
+            else None
+        ),
+    }
+    for parameter in sweep:
+        if parameter not in SWEEP_PARAMETERS:
+            raise Exception(
+                f"... unknown sweep parameter ({parameter}), use some of {SWEEP_PARAMETERS}. Check config.json."
+            )
+
+    values = [
+        sweep[parameter] if parameter in sweep else [defaults[parameter]]
+        for parameter in SWEEP_PARAMETERS
+    ]
+    return [
+        dict(zip(SWEEP_PARAMETERS, combination))
+        for combination in itertools.product(*values)
+    ]
+
+
+def get_combination_config(config, combination):
+    """Finder config with the parameters of the combination"""
+    smoothness = {**config["smoothness"], "profile": combination["smooth_window"] is not None}
+    if combination["smooth_window"] is not None:
+        smoothness["window"] = combination["smooth_window"]
+    return {
+        **config,
+        "elevation_zero": combination["elevation_zero"],
+        "min_profile_points": combination["min_profile_points"],
+        "beyond_top_buffer": combination["beyond_top_buffer"],
+        "smoothness": smoothness,
+    }
+
+
+def load_sweep_profiles(config):
+    """Prepared batches (see prepare_batch) of all (selected) profiles and their count
+
+    Profiles are read once and searched with every combination of the sweep.
+    """
+    if "profiles_store" in config["paths"]["input"]:
+        profile_batches = iter_frame_batches(read_store_profiles(config))
+    else:
+        profile_batches = iter_batches(
+            iter_csv_profiles(list_profile_files(config), config["csv"]["sep"])
+        )
+
+    batches = [prepare_batch(*batch) for batch in profile_batches]
+    return batches, sum(len(batch["profile_ids"]) for batch in batches)
+
+
+def sweep_profiles(config, batches, profiles_count, is_gui=False):
+    """Zero, base and top points of the profiles for every combination of the sweep
+
+    Returns a tidy table of the results (combination, its parameters, profile
+    and its points) and the summary of every combination: number of results,
+    of profiles with base and top points and mean point numbers.
+    """
+    combinations = get_combinations(config)
+
+    results = []
+    with tqdm(total=len(combinations), desc="... sweep", disable=is_gui) as progress:
+        for idx, combination in enumerate(combinations):
+            combination_config = get_combination_config(config, combination)
+            for batch in batches:
+                results.extend(
+                    {"combination": idx, **combination, **result}
+                    for result in search_prepared(combination_config, batch)
+                )
+            progress.update(1)
+            if is_gui:
+                print(f"... processing combination {idx + 1}/{len(combinations)}")
+
+    columns = ["combination"] + SWEEP_PARAMETERS
+    results = pd.DataFrame(
+        results,
+        columns=columns
+        + [
+            "profile_id",
+            "method",
+            "profile_smooth",
+            "first_zero",
+            "last_zero",
+            "bottom",
+            "top",
+        ],
+    )
+
+    points = results.assign(
+        main_points=results["bottom"].notna() & results["top"].notna()
+    )
+    summary = points.groupby("combination").agg(
+        results=("profile_id", "size"),
+        main_points=("main_points", "sum"),
+        first_zero_mean=("first_zero", "mean"),
+        last_zero_mean=("last_zero", "mean"),
+        bottom_mean=("bottom", "mean"),
+        top_mean=("top", "mean"),
+    )
+    summary = (
+        pd.DataFrame(combinations)
+        .rename_axis("combination")
+        .join(summary)
+        .fillna({"results": 0, "main_points": 0})
+        .astype({"results": int, "main_points": int})
+        .reset_index()
+    )
+    summary.insert(len(columns), "profiles", profiles_count)
+    summary["main_points_share"] = (
+        summary["main_points"] / profiles_count if profiles_count else 0.0
+    )
+    return results, summary
+
+
+def export_sweep(config, results, summary):
+    """Write the sweep results and their summary to the sweep CSV files"""
+    with AsyncWriter(threads=2) as writer:
+        for table, name in [(results, "sweep"), (summary, "sweep_summary")]:
+            file = join(config["paths"]["base"], config["paths"]["output"][name])
+            makedirs(dirname(file), exist_ok=True)
+            writer.submit(
+                table.to_csv, file, sep=config["csv"]["sep"], index=False, encoding="utf-8"
+            )
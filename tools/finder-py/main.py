@@ -1,14 +1,15 @@
 import sys
-import re
 import json
-import glob
-from natsort import natsorted
-import pandas as pd
-import numpy as np
-from os.path import join, basename
-from tqdm import tqdm
+import argparse
+from os.path import join, dirname, abspath
 
-from finder import smooth_profile, get_main_points, get_zero_points
+# modules shared by the tools (profile store, manifest, writer, resources)
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), "shared-py"))
+
+from finder.search import load_profiles, search_profiles
+from finder.search import get_results_files, get_search_hash, export_results
+from finder.sweep import load_sweep_profiles, sweep_profiles, export_sweep
+from shared.manifest import is_up_to_date
 
 # Check if running in GUI mode (streamlit subprocess)
 IS_GUI = "--gui" in sys.argv
@@ -17,110 +18,52 @@ IS_GUI = "--gui" in sys.argv
 YELLOW = "\033[93m"
 RESET = "\033[0m"
 
-pd.options.mode.chained_assignment = None
-
-try:
-    # get config
-    with open("config.json", "r") as jsonfile:
-        config = json.load(jsonfile)
-
-    profile_input_path = join(
-        config["paths"]["base"], config["paths"]["input"]["profiles"]
-    )
-
-    csv_sep = config["csv"]["sep"]
-    method = config["method"]
-    elevation_zero = config["elevation_zero"]
-
-    # all or selected profiles?
-    selected = True if len(config["selected_profiles"]) > 0 else False
-
-    # list of obtained results
-    results = []
-
-    # list profile files
-    profile_files = natsorted(glob.glob(f"{profile_input_path}/*.csv"))
-    profile_files_count = len(profile_files)
-    # counter = 0
-
-    print(f"{YELLOW}... looking for the base and top of profiles{RESET}")
-
-    if IS_GUI:
-        profile_iterator = enumerate(profile_files, 1)
-    else:
-        profile_iterator = tqdm(enumerate(profile_files, 1), total=len(profile_files), desc="... all profiles")
-
-    for idx, name in profile_iterator:
-        if IS_GUI:
-            print(f"... processing profile {idx}/{len(profile_files)}")
-
-        # get profile number from file name
-        profile_id = int(re.findall(r"\d{1,4}", basename(name))[0])
-
-        if selected and profile_id not in config["selected_profiles"]:
-            continue
-
-        csv = pd.read_csv(name, encoding="utf-8", sep=csv_sep, skipinitialspace=True)
-        cut = csv[csv["id"] > 0]
-        if len(cut) == 0:
-            continue
-
-        first_no = cut.iloc[0]["no_point"].astype(int).item()
-        buffer = config["beyond_top_buffer"] if method == 2 else 0
-        highest_point = cut.elevation.idxmax().astype(int).item() + buffer
-        last_point = cut["no_point"].iloc[-1]
-        last_no = last_point if highest_point > last_point else highest_point
-
-        zero_result = get_zero_points(
-            csv,
-            first_no,
-            last_no,
-            elevation_zero,
-            min_profile_points=config["min_profile_points"],
-        )
-        if first_no < zero_result["last"]:
-            first_no = zero_result["last"]
-
-        if config["smoothness"]["profile"]:
-            smooth = smooth_profile(csv, first_no, last_no)
-            if smooth is not None:
-                csv.elevation[first_no:last_no] = np.array(smooth)
-            else:
-                continue
-
-        if method == 2:
-            result = get_main_points(
-                csv,
-                first_no,
-                last_no,
-                method=2,
-                min_profile_points=config["min_profile_points"],
-            )
-
-        results.append(
-            {
-                "profile_id": profile_id,
-                "method": method,
-                "profile_smooth": config["smoothness"]["profile"],
-                "first_zero": zero_result["first"],
-                "last_zero": zero_result["last"],
-                "bottom": result["bottom"],
-                "top": result["top"],
-            }
-        )
-
-
-    results = pd.DataFrame(results)
-
-    # export results to CSV file/files (all profiles together)
-    print(f"{YELLOW}... exporting CSV data{RESET}")
-    output = config["paths"]["output"]["results"]
-    files = output if isinstance(output, list) else [output]
-    for file in files:
-        file = join(config["paths"]["base"], file)
-        results.to_csv(file, sep=csv_sep, index=False, encoding="utf-8")
-    sys.exit(0)
-
-except Exception as e:
-    print(f"{type(e)}: {e}")
-    sys.exit(1)
+# get config
+with open("config.json", "r") as jsonfile:
+    config = json.load(jsonfile)
+
+# CPU budget of the worker processes from the command line (--cpus N), the
+# other options are flags checked in sys.argv
+parser = argparse.ArgumentParser(prog="main.py")
+parser.add_argument("--cpus", help="CPU budget (N or auto)")
+options, _ = parser.parse_known_args()
+if options.cpus is not None:
+    config.setdefault("resources", {})["cpus"] = options.cpus
+
+# guard: workers of the process pool import this module
+if __name__ == "__main__":
+    try:
+        # sweep mode: search the profiles (read once) with every combination of
+        # the parameters of the sweep section
+        if "--sweep" in sys.argv:
+            batches, profiles_count = load_sweep_profiles(config)
+
+            print(f"{YELLOW}... sweeping the finder parameters{RESET}")
+            results, summary = sweep_profiles(config, batches, profiles_count, IS_GUI)
+
+            print(f"{YELLOW}... exporting CSV data{RESET}")
+            export_sweep(config, results, summary)
+            sys.exit(0)
+
+        # skip the search if neither the config (but the CPU budget and the
+        # sweep) nor the profiles changed since the last run
+        stage_hash = get_search_hash(config)
+        if "--force" not in sys.argv and is_up_to_date(
+            config, "finder", stage_hash, get_results_files(config)
+        ):
+            print(f"{YELLOW}... results are up to date{RESET}")
+            sys.exit(0)
+
+        profile_chunks, profiles_count = load_profiles(config)
+
+        print(f"{YELLOW}... looking for the base and top of profiles{RESET}")
+        results = search_profiles(config, profile_chunks, profiles_count, IS_GUI)
+
+        # export results to CSV file/files (all profiles together)
+        print(f"{YELLOW}... exporting CSV data{RESET}")
+        export_results(config, results, stage_hash)
+        sys.exit(0)
+
+    except Exception as e:
+        print(f"{type(e)}: {e}")
+        sys.exit(1)
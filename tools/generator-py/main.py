@@ -7,6 +7,12 @@ geopackage database.gpkg can be opened in QGIS
 
 import sys
 import json
+import argparse
+from os.path import join, dirname, abspath
+
+# modules shared by the tools (profile store, manifest, writer, resources)
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), "shared-py"))
+
 import pgen
 
 # Check if running in GUI mode (streamlit subprocess)
@@ -21,29 +27,80 @@ RED = "\033[91m"
 with open("config.json", "r") as jsonfile:
     config = json.load(jsonfile)
 
-try:
-    # check input and db paths and create output paths
-    print(f"{YELLOW}... initializing data structures{RESET}")
-    pgen.init(config)
+# CPU and memory budget from the command line (--cpus N, --memory MB), the
+# other options are flags checked in sys.argv
+parser = argparse.ArgumentParser(prog="main.py")
+parser.add_argument("--cpus", help="CPU budget (N or auto)")
+parser.add_argument("--memory", help="memory budget in MB (or auto)")
+options, _ = parser.parse_known_args()
+for option in ["cpus", "memory"]:
+    if getattr(options, option) is not None:
+        config.setdefault("resources", {})[option] = getattr(options, option)
+
+# guard: workers of the process executor backend import this module
+if __name__ == "__main__":
+    try:
+        # stages with inputs changed since the last run (all of them with --force)
+        force = "--force" in sys.argv
+        hashes = pgen.get_stage_hashes(config)
+
+        # resume an interrupted run: skip tasks journaled with the same inputs
+        resume = "--resume" in sys.argv and not force
+        journal = pgen.Journal(config, {**hashes, "crop": hashes["profiles"]}, resume)
+
+        # crop already generated profiles only (standalone cropping stage)
+        if "--crop-only" in sys.argv:
+            print(f"{YELLOW}... cropping profiles{RESET}")
+            pgen.crop_profiles(config, journal)
+            sys.exit(0)
+
+        stale = pgen.get_stale_stages(config, hashes, force=force)
+
+        # check input and db paths and create output paths
+        print(f"{YELLOW}... initializing data structures{RESET}")
+        pgen.init(config, stale, resume)
 
-    # generate or load transects
-    print(f"{YELLOW}... generating transects{RESET}")
-    pgen.generate_transects(config)
+        # generate or load transects
+        if "transects" in stale:
+            print(f"{YELLOW}... generating transects{RESET}")
+            pgen.generate_transects(config)
+            pgen.update_manifest(config, "transects", hashes["transects"])
+        else:
+            print(f"{YELLOW}... transects are up to date{RESET}")
 
-    # get DEM around transects
-    print(f"{YELLOW}... preparing cropped DEM rasters{RESET}")
-    pgen.get_DEM(config)
+        if "dem" in stale and "profiles" in stale and config["parameters"].get(
+            "pipeline", False
+        ):
+            # crop DEM rasters, generate (and crop) profiles in overlapping stages
+            print(f"{YELLOW}... generating profiles (pipelined){RESET}")
+            pgen.generate_pipeline(config, journal)
+            pgen.update_manifest(config, "dem", hashes["dem"])
+            pgen.update_manifest(config, "profiles", hashes["profiles"])
+            sys.exit(0)
 
-    # generate profiles
-    print(f"{YELLOW}... generating profiles{RESET}")
-    pgen.generate_profiles(config)
+        # get DEM around transects
+        windows = None
+        try:
+            if "dem" in stale:
+                print(f"{YELLOW}... preparing cropped DEM rasters{RESET}")
+                windows = pgen.get_DEM(config, journal)
+                pgen.update_manifest(config, "dem", hashes["dem"])
+            else:
+                print(f"{YELLOW}... cropped DEM rasters are up to date{RESET}")
 
-    # crop profiles
-    print(f"{YELLOW}... cropping profiles{RESET}")
-    pgen.crop_profiles(config)
+            # generate (and crop) profiles
+            if "profiles" in stale:
+                print(f"{YELLOW}... generating profiles{RESET}")
+                pgen.generate_profiles(config, windows, journal)
+                pgen.update_manifest(config, "profiles", hashes["profiles"])
+            else:
+                print(f"{YELLOW}... profiles are up to date{RESET}")
+        finally:
+            # memory-mapped window files are removed when profiling fails too
+            pgen.release_windows(windows)
 
-    sys.exit(0)
+        sys.exit(0)
 
-except Exception as e:
-    print(f"{RED}{type(e)}: {e}{RESET}")
-    sys.exit(1)
+    except Exception as e:
+        print(f"{RED}{type(e)}: {e}{RESET}")
+        sys.exit(1)
@@ -1,5 +1,13 @@
 from pgen.helper import init
 from pgen.transect import generate_transects
 from pgen.dem import get_DEM
+from pgen.dem import release_windows
 from pgen.profile import generate_profiles
 from pgen.profile import crop_profiles
+from pgen.manifest import get_stage_hashes
+from pgen.manifest import get_stale_stages
+from pgen.manifest import update_manifest
+from pgen.journal import Journal
+from pgen.pipeline import generate_pipeline
+from pgen.sink import MemorySink
+from pgen.stack import sample_stack
@@ -0,0 +1,73 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import numpy as np
+import shapely
+import geopandas as gpd
+from contextlib import closing, contextmanager
+from os.path import exists, getmtime, dirname
+
+# Site cache: GeoPackage shared by the surveys of a site, with layers of
+# equal inputs named {name}_{key} (see get_cache_key).
+
+# lock of the site cache: waiting time between attempts, age of a stale lock (s)
+LOCK_WAIT = 0.1
+LOCK_TIMEOUT = 600
+
+
+def get_cache_key(geometries, *parameters):
+    """Short hash of the geometries (WKB) and the parameters of the cached layers"""
+    digest = hashlib.sha256(b"".join(shapely.to_wkb(np.asarray(geometries)).tolist()))
+    digest.update(json.dumps(parameters, default=str).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+@contextmanager
+def cache_lock(cache):
+    """Exclusive access to the site cache (surveys of a batch run share it)"""
+    lock_file = f"{cache}.lock"
+    os.makedirs(dirname(lock_file) or ".", exist_ok=True)
+    while True:
+        try:
+            fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - getmtime(lock_file) > LOCK_TIMEOUT:
+                    os.remove(lock_file)  # left by a killed run
+            except OSError:
+                pass
+            time.sleep(LOCK_WAIT)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_file)
+
+
+def has_layer(cache, layer):
+    if not exists(cache):
+        return False
+    with closing(sqlite3.connect(cache, timeout=60)) as connection:
+        return (
+            connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (layer,),
+            ).fetchone()
+            is not None
+        )
+
+
+def read_cached(cache, layers, key):
+    """Cached layers ({name}_{key}), None if any of them is missing"""
+    if not all(has_layer(cache, f"{name}_{key}") for name in layers):
+        return None
+    return [gpd.read_file(cache, layer=f"{name}_{key}") for name in layers]
+
+
+def write_cached(cache, frames, key):
+    """Store the layers ({name: frame}) in the site cache"""
+    for name, frame in frames.items():
+        frame.to_file(cache, layer=f"{name}_{key}", driver="GPKG")
@@ -1,4 +1,4 @@
-from os.path import join, basename
+from os.path import join, basename, normpath
 
 
 def parse(cfg, fname):
@@ -20,6 +20,18 @@ def _get_DEM(cfg):
             if "buffer_width" in cfg["parameters"]
             else cfg["parameters"]["transect_distance"] / 2
         ),  # buffer_width == transect_distance / 2
+        (
+            cfg["parameters"]["export_dem_rasters"]
+            if "export_dem_rasters" in cfg["parameters"]
+            else False
+        ),  # export_rasters
+        (
+            cfg["parameters"]["dem_mosaic"]
+            if "dem_mosaic" in cfg["parameters"]
+            else False
+        ),  # mosaic: DEM files are tiles of a single mosaic
+        _executor(cfg),  # executor
+        _resources(cfg),  # resources
     )
 
 
@@ -32,6 +44,7 @@ def _generate_transects(cfg):
         cfg["db_layers"]["transects"],  # transects_layer
         cfg["parameters"]["transect_distance"],  # transect_distance
         cfg["parameters"]["transect_length"],  # transect_length
+        _transect_cache(cfg),  # transect_cache
     )
 
 
@@ -47,7 +60,28 @@ def _generate_profiles(cfg):
         cfg["db_layers"]["profiles"],  # profiles_layer
         cfg["db_layers"]["transects"],  # transects_layer
         cfg["parameters"]["profile_resolution"],  # resolution
-        cfg["csv"],  # csv
+        (
+            cfg["parameters"]["slope_method"]
+            if "slope_method" in cfg["parameters"]
+            else "raster"
+        ),  # slope_method: raster (Horn) or profile (along-profile gradient)
+        (
+            cfg["parameters"]["sampling_method"]
+            if "sampling_method" in cfg["parameters"]
+            else "nearest"
+        ),  # sampling_method: nearest, bilinear or cubic
+        (
+            cfg["parameters"]["dem_mosaic"]
+            if "dem_mosaic" in cfg["parameters"]
+            else False
+        ),  # mosaic: DEM files are tiles of a single mosaic
+        _csv(cfg),  # csv
+        _store_path(cfg),  # store_path
+        _survey(cfg),  # survey
+        join(base_path, cfg["paths"]["input"]["crop"]),  # buffer_path
+        join(base_path, cfg["paths"]["output"]["profiles_cropped"]),  # cropped_profile_path
+        _executor(cfg),  # executor
+        _resources(cfg),  # resources
     )
 
 
@@ -58,5 +92,56 @@ def _crop_profiles(cfg):
         join(base_path, cfg["paths"]["input"]["crop"]),  # buffer_path
         join(base_path, cfg["paths"]["output"]["profiles_whole"]),  # in_profile_path
         join(base_path, cfg["paths"]["output"]["profiles_cropped"]),  # out_profile_path
-        cfg["csv"],  # csv
+        _csv(cfg),  # csv
+        _store_path(cfg),  # store_path
+        _survey(cfg),  # survey
+    )
+
+
+def _executor(cfg):
+    # executor backend of the parallel stages: thread, process or serial
+    return (
+        cfg["parameters"]["executor"]
+        if "executor" in cfg["parameters"]
+        else "thread"
+    )
+
+
+def _resources(cfg):
+    # CPU and memory budget of the parallel stages (auto when missing)
+    return cfg["resources"] if "resources" in cfg else {}
+
+
+def _transect_cache(cfg):
+    # site cache of transects (GeoPackage shared by the surveys)
+    if "transect_cache" in cfg["paths"]:
+        return join(cfg["paths"]["base"], cfg["paths"]["transect_cache"])
+    return None
+
+
+def _profile_formats(cfg):
+    return (
+        cfg["parameters"]["profile_formats"]
+        if "profile_formats" in cfg["parameters"]
+        else ["csv"]
     )
+
+
+def _csv(cfg):
+    # csv settings, export: CSV files are one of the profile formats
+    return {**cfg["csv"], "export": "csv" in _profile_formats(cfg)}
+
+
+def _store_path(cfg):
+    # columnar profile store (Parquet) if it is one of the profile formats
+    if (
+        "parquet" in _profile_formats(cfg)
+        and "profiles_store" in cfg["paths"]["output"]
+    ):
+        return join(cfg["paths"]["base"], cfg["paths"]["output"]["profiles_store"])
+    return None
+
+
+def _survey(cfg):
+    # survey name (partition of the profile store) == name of the base folder
+    return basename(normpath(cfg["paths"]["base"]))
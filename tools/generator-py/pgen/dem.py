@@ -1,19 +1,27 @@
 import glob
+import shutil
+import tempfile
+import threading
+import numpy as np
 import geopandas as gpd
-from osgeo import gdal, gdalconst
+import shapely
+from osgeo import gdal, gdalconst, osr
 import os
-from os.path import join, basename
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from math import ceil, floor
+from os.path import join, basename, splitext, abspath, dirname
 import pgen.config as config
 import concurrent.futures
+from pgen.executor import get_executor
+from pgen.resources import get_resources
 from tqdm import tqdm  # For progress tracking
 
 import sys
 IS_GUI = "--gui" in sys.argv
 
 gdal.UseExceptions()
-gdal.SetConfigOption("GDAL_NUM_THREADS", "ALL_CPUS")  # Use all available CPU threads
 gdal.SetConfigOption("CPL_TMPDIR", "/tmp")  # Faster temporary directory if available
-gdal.SetConfigOption("GDAL_CACHEMAX", "512")  # Increase cache to 512MB
 gdal.SetConfigOption("VSI_CACHE", "TRUE")
 gdal.SetConfigOption("VSI_CACHE_SIZE", "32000000")  # 32MB cache for file access
 try:
@@ -22,59 +30,359 @@ except:
     pass  # If OpenCL isn't available, continue without it
 
 
-def process_buffer(
+def set_gdal_resources(gdal_threads, gdal_cachemax):
+    """GDAL threads and block cache (MB) of the worker (process)"""
+    gdal.SetConfigOption("GDAL_NUM_THREADS", str(gdal_threads))
+    gdal.SetCacheMax(gdal_cachemax * 2**20)
+
+
+def get_stage_resources(resources, tasks, backend):
+    """Resources of the stage workers, GDAL resources set in the calling process"""
+    stage_resources = get_resources(resources, tasks, backend)
+    set_gdal_resources(
+        stage_resources["gdal_threads"], stage_resources["gdal_cachemax"]
+    )
+    print(
+        f"... {stage_resources['workers']} worker(s), "
+        f"{stage_resources['gdal_threads']} GDAL thread(s) and "
+        f"{stage_resources['gdal_cachemax']} MB GDAL cache per worker"
+    )
+    return stage_resources
+
+
+# DEM name of the profiles when DEM files are tiles of a single mosaic
+MOSAIC_NAME = "mosaic.vrt"
+
+# source DEM datasets kept open by every worker (thread or process)
+DATASET_CACHE_SIZE = 8
+_datasets = threading.local()
+
+
+def get_dataset(input_file):
+    """Open the DEM once per worker, least recently used datasets are closed"""
+    cache = getattr(_datasets, "cache", None)
+    if cache is None:
+        cache = _datasets.cache = OrderedDict()
+
+    if input_file in cache:
+        cache.move_to_end(input_file)
+    else:
+        cache[input_file] = gdal.Open(input_file, gdal.GA_ReadOnly)
+        if len(cache) > DATASET_CACHE_SIZE:
+            cache.popitem(last=False)  # Close the dataset
+    return cache[input_file]
+
+
+def clear_datasets():
+    """Close the datasets of the calling worker"""
+    _datasets.cache = OrderedDict()
+
+
+def get_window(geotransform, raster_x_size, raster_y_size, bounds):
+    """Pixel window (xoff, yoff, xsize, ysize) of the raster covering the bounds"""
+    x_origin, pixel_width, _, y_origin, _, pixel_height = geotransform
+    minx, miny, maxx, maxy = bounds
+
+    col_min = max(floor((minx - x_origin) / pixel_width), 0)
+    col_max = min(ceil((maxx - x_origin) / pixel_width), raster_x_size)
+    row_min = max(floor((maxy - y_origin) / pixel_height), 0)
+    row_max = min(ceil((miny - y_origin) / pixel_height), raster_y_size)
+
+    if col_min >= col_max or row_min >= row_max:
+        return None
+    return col_min, row_min, col_max - col_min, row_max - row_min
+
+
+def get_window_mask(geotransform, window, geometry):
+    """Rasterize the geometry over the window (pixel centers inside the geometry)"""
+    x_origin, pixel_width, _, y_origin, _, pixel_height = geotransform
+    xoff, yoff, xsize, ysize = window
+
+    x = x_origin + (xoff + np.arange(xsize) + 0.5) * pixel_width
+    y = y_origin + (yoff + np.arange(ysize) + 0.5) * pixel_height
+    xx, yy = np.meshgrid(x, y)
+    return shapely.contains_xy(geometry, xx, yy)
+
+
+def crop_window(dem_input, geometry, src_nodata, dst_nodata):
+    """Read the window of the DEM around the geometry and mask it with the geometry"""
+    geotransform = dem_input.GetGeoTransform()
+    window = get_window(
+        geotransform, dem_input.RasterXSize, dem_input.RasterYSize, geometry.bounds
+    )
+    if window is None:
+        return None, None
+
+    xoff, yoff, xsize, ysize = window
+    data = (
+        dem_input.GetRasterBand(1)
+        .ReadAsArray(xoff, yoff, xsize, ysize)
+        .astype(np.float32)
+    )
+
+    valid = get_window_mask(geotransform, window, geometry) & ~np.isnan(data)
+    if src_nodata is not None:
+        valid &= data != np.float32(src_nodata)
+
+    # Skip empty windows (no data or only zeros inside the geometry)
+    if not valid.any() or not data[valid].any():
+        return None, None
+
+    cropped = np.full(data.shape, dst_nodata, dtype=np.float32)
+    cropped[valid] = data[valid]
+
+    window_geotransform = (
+        geotransform[0] + xoff * geotransform[1],
+        geotransform[1],
+        0,
+        geotransform[3] + yoff * geotransform[5],
+        0,
+        geotransform[5],
+    )
+    return cropped, window_geotransform
+
+
+def horn_slope(array, rows, cols, geotransform, nodata, slope_nodata=-9999):
+    """Slope in degrees of the pixels at rows/cols (Horn method, as gdal.DEMProcessing)
+
+    Only the 3x3 neighbourhoods of the given pixels are evaluated. Pixels on the
+    edge of the array or with nodata in the neighbourhood get slope_nodata.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    height, width = array.shape
+
+    inside = (rows >= 1) & (rows < height - 1) & (cols >= 1) & (cols < width - 1)
+    r = np.clip(rows, 1, max(height - 2, 1))
+    c = np.clip(cols, 1, max(width - 2, 1))
+
+    # 3x3 neighbourhood: a b c / d e f / g h i
+    n = np.stack(
+        [
+            array[np.clip(r + dr, 0, height - 1), np.clip(c + dc, 0, width - 1)]
+            for dr in (-1, 0, 1)
+            for dc in (-1, 0, 1)
+        ]
+    ).astype(np.float64)
+
+    valid = inside & ~np.isnan(n).any(axis=0)
+    if nodata is not None:
+        valid &= ~(n == nodata).any(axis=0)
+
+    dx = ((n[2] + 2 * n[5] + n[8]) - (n[0] + 2 * n[3] + n[6])) / (
+        8 * abs(geotransform[1])
+    )
+    dy = ((n[6] + 2 * n[7] + n[8]) - (n[0] + 2 * n[1] + n[2])) / (
+        8 * abs(geotransform[5])
+    )
+    slope = np.degrees(np.arctan(np.sqrt(dx**2 + dy**2)))
+    return np.where(valid, slope, slope_nodata)
+
+
+def write_raster(file, array, geotransform, projection, nodata, driver="GTiff"):
+    dataset = gdal.GetDriverByName(driver).Create(
+        file, array.shape[1], array.shape[0], 1, gdalconst.GDT_Float32
+    )
+    dataset.SetGeoTransform(geotransform)
+    dataset.SetProjection(projection)
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(nodata)
+    band.WriteArray(array)
+    band.FlushCache()
+    return dataset
+
+
+def get_window_file(path, buffer_idx, kind, input_file):
+    """Exported raster ({idx}_crop_*.tif or {idx}_slope_*.tif) of a buffer"""
+    return join(path, f"{buffer_idx}_{kind}_{splitext(basename(input_file))[0]}.tif")
+
+
+def read_window(cropped_path, input_file, buffer_idx):
+    """Read the cropped raster of a buffer exported by get_DEM"""
+    cropped_file = get_window_file(cropped_path, buffer_idx, "crop", input_file)
+    if not os.path.exists(cropped_file):
+        return None
+
+    height_raster = gdal.Open(cropped_file, gdal.GA_ReadOnly)
+    window = {
+        "elevation": height_raster.GetRasterBand(1).ReadAsArray(),
+        "geotransform": height_raster.GetGeoTransform(),
+        "nodata": height_raster.GetRasterBand(1).GetNoDataValue(),
+    }
+    height_raster = None
+    return window
+
+
+def share_windows(windows, shared_file):
+    """Pack the windows into a single memory-mapped file, returns their references"""
+    sizes = [window["elevation"].size for window in windows.values()]
+    shared = np.lib.format.open_memmap(
+        shared_file, mode="w+", dtype=np.float32, shape=(sum(sizes),)
+    )
+
+    references = {}
+    offset = 0
+    for (key, window), size in zip(windows.items(), sizes):
+        shared[offset : offset + size] = window["elevation"].ravel()
+        references[key] = {
+            "file": shared_file,
+            "offset": offset,
+            "shape": window["elevation"].shape,
+            "geotransform": window["geotransform"],
+            "nodata": window["nodata"],
+        }
+        offset += size
+
+    shared.flush()
+    del shared  # Close the file
+    return references
+
+
+@lru_cache(maxsize=64)
+def get_shared_array(shared_file):
+    return np.load(shared_file, mmap_mode="r")
+
+
+def attach_window(window):
+    """Window with a zero-copy view of its elevation in the memory-mapped file"""
+    if "file" not in window:
+        return window
+
+    size = int(np.prod(window["shape"]))
+    elevation = get_shared_array(window["file"])[
+        window["offset"] : window["offset"] + size
+    ].reshape(window["shape"])
+    return {
+        "elevation": elevation,
+        "geotransform": window["geotransform"],
+        "nodata": window["nodata"],
+    }
+
+
+def release_windows(windows):
+    """Remove the memory-mapped files of the shared windows"""
+    if not windows:
+        return
+
+    for path in {dirname(w["file"]) for w in windows.values() if "file" in w}:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def process_buffers(
     input_file,
-    buffer_idx,
+    buffers,
     cropped_path,
     slope_path,
-    db,
-    buffers_layer,
-    crs,
+    projection,
     src_nodata,
     dst_nodata,
+    export_rasters,
+    shared_path=None,
 ):
-    """Process a single buffer for a given DEM file"""
-    dem_cropped_file = join(cropped_path, f"{buffer_idx}_crop_{basename(input_file)}")
-
-    options = gdal.WarpOptions(
-        srcSRS=crs,
-        dstSRS=crs,
-        srcNodata=src_nodata,
-        dstNodata=dst_nodata,
-        format="GTiff",
-        cutlineDSName=db,
-        cutlineLayer=buffers_layer,
-        cutlineWhere=f"fid={buffer_idx}",
-        cropToCutline=True,
-        outputType=gdalconst.GDT_Float32,
-    )
+    """Process a chunk of buffers for a given DEM file (opened once per worker)
+
+    With shared_path windows are written to a memory-mapped file there and
+    only their references are returned (no pickling of arrays between processes).
+    """
+    windows = {}
 
-    dem_input = gdal.Open(input_file, gdal.GA_ReadOnly)
-    gdal_dataset = gdal.Warp(dem_cropped_file, dem_input, options=options)
-    dem_input = None  # Close the input dataset
+    dem_input = get_dataset(input_file)
 
-    max_val, min_val, mean, stddev = gdal_dataset.GetRasterBand(1).GetStatistics(0, 1)
+    for buffer_idx, geometry in buffers:
+        cropped, geotransform = crop_window(
+            dem_input, geometry, src_nodata, dst_nodata
+        )
 
-    # Skip empty datasets
-    if mean == 0 and stddev == 0:
-        gdal_dataset = None  # Close dataset
-        if os.path.exists(dem_cropped_file):
-            os.remove(dem_cropped_file)
-        return False
+        # Skip empty datasets
+        if cropped is None:
+            continue
 
-    # Process slope
-    slope_file = join(slope_path, f"{buffer_idx}_slope_{basename(input_file)}")
-    dem_cropped = gdal.Open(dem_cropped_file, gdal.GA_ReadOnly)
-    gdal.DEMProcessing(slope_file, dem_cropped, "slope")
+        # Rasters are written only on demand, the slope of the whole
+        # raster is calculated only for the exported (debug) rasters,
+        # profiles calculate it only where they are sampled
+        if export_rasters:
+            dem_cropped = write_raster(
+                get_window_file(cropped_path, buffer_idx, "crop", input_file),
+                cropped,
+                geotransform,
+                projection,
+                dst_nodata,
+            )
+            gdal.DEMProcessing(
+                get_window_file(slope_path, buffer_idx, "slope", input_file),
+                dem_cropped,
+                "slope",
+            )
+            dem_cropped = None  # Close dataset
 
-    # Close datasets
-    dem_cropped = None
-    gdal_dataset = None
+        windows[(basename(input_file), buffer_idx)] = {
+            "elevation": cropped,
+            "geotransform": geotransform,
+            "nodata": dst_nodata,
+        }
 
-    return True
+    if shared_path is not None and windows:
+        shared_file = join(
+            shared_path, f"{splitext(basename(input_file))[0]}_{buffers[0][0]}.npy"
+        )
+        return share_windows(windows, shared_file)
+    return windows
 
 
-def get_DEM(cfg):
+def get_dem_index(dem_input_files):
+    """DEM tile index: footprints and nodata of the DEM files and STRtree of footprints"""
+    footprints, nodata = [], []
+    for input_file in dem_input_files:
+        dem_input = gdal.Open(input_file, gdal.GA_ReadOnly)
+        x_origin, pixel_width, _, y_origin, _, pixel_height = dem_input.GetGeoTransform()
+        x_end = x_origin + dem_input.RasterXSize * pixel_width
+        y_end = y_origin + dem_input.RasterYSize * pixel_height
+        footprints.append(
+            shapely.box(
+                min(x_origin, x_end),
+                min(y_origin, y_end),
+                max(x_origin, x_end),
+                max(y_origin, y_end),
+            )
+        )
+        nodata.append(dem_input.GetRasterBand(1).GetNoDataValue())
+        dem_input = None  # Close the dataset
+
+    return {
+        "files": dem_input_files,
+        "footprints": footprints,
+        "nodata": nodata,
+        "tree": shapely.STRtree(footprints),
+    }
+
+
+def get_mosaic(dem_index, mosaic_path="/vsimem"):
+    """Single DEM index entry of a VRT mosaic of all DEM tiles (in memory by default)"""
+    mosaic_file = join(mosaic_path, MOSAIC_NAME)
+    mosaic = gdal.BuildVRT(mosaic_file, [abspath(file) for file in dem_index["files"]])
+    mosaic = None  # Close (write) the VRT
+
+    footprint = shapely.union_all(dem_index["footprints"])
+    return {
+        "files": [mosaic_file],
+        "footprints": [footprint],
+        "nodata": [dem_index["nodata"][0]],
+        "tree": shapely.STRtree([footprint]),
+    }
+
+
+def get_buffer_task(input_file, buffer_idx):
+    """Journal task name of a (DEM, buffer) pair"""
+    return f"{basename(input_file)}:{buffer_idx}"
+
+
+def get_DEM(cfg, journal=None, windows_queue=None):
+    """Crop DEM windows around the transect buffers
+
+    Returns the windows keyed by (DEM file name, buffer fid). With a queue
+    (pipelined stages) windows are put there as soon as a chunk is cropped,
+    followed by ("dem", order, DEM file) when all windows of the DEM are put.
+    """
     (
         dem_path,
         cropped_path,
@@ -84,12 +392,19 @@ def get_DEM(cfg):
         buffers_layer,
         crs,
         buffer_width,
+        export_rasters,
+        mosaic,
+        backend,
+        resources,
     ) = config.parse(cfg, get_DEM.__name__)
 
+    shared_path = None
+    mosaic_path = mosaic_file = None
     try:
         # Create output directories if they don't exist
-        os.makedirs(cropped_path, exist_ok=True)
-        os.makedirs(slope_path, exist_ok=True)
+        if export_rasters:
+            os.makedirs(cropped_path, exist_ok=True)
+            os.makedirs(slope_path, exist_ok=True)
 
         dem_input_files = glob.glob(join(dem_path, "*.tif"))
         if not dem_input_files:
@@ -100,48 +415,137 @@ def get_DEM(cfg):
         transects = gpd.read_file(db, layer=transects_layer).to_crs(crs)
         buffers = transects.buffer(buffer_width)
         buffers.to_file(db, layer=buffers_layer, driver="GPKG")
-        buffers_count = len(buffers.index)
 
-        # Get a sample DEM file to extract nodata value
-        sample_dem = gdal.Open(dem_input_files[0], gdal.GA_ReadOnly)
-        src_nodata = sample_dem.GetRasterBand(1).GetNoDataValue()
+        buffer_geometries = list(enumerate(buffers.geometry, 1))
+        for _, geometry in buffer_geometries:
+            shapely.prepare(geometry)
+
+        srs = osr.SpatialReference()
+        srs.SetFromUserInput(crs)
+        projection = srs.ExportToWkt()
         dst_nodata = -9999
-        sample_dem = None  # Close the dataset
 
-        # Create all tasks for parallel processing
-        tasks = []
-        for input_file in dem_input_files:
-            for buffer_idx in range(1, buffers_count + 1):
-                tasks.append(
+        # (DEM, buffer) pairs finished before the run was interrupted, they
+        # can be reused only when their windows were exported
+        done = journal.start("dem") if journal is not None else set()
+        if not export_rasters:
+            done = set()
+
+        # Schedule only (DEM, buffer) pairs whose footprints intersect, tiles
+        # of the mosaic are read through the VRT (tile-seam buffers included)
+        dem_index = get_dem_index(dem_input_files)
+        if mosaic:
+            # workers of the process pool cannot read the in-memory VRT
+            mosaic_path = tempfile.mkdtemp() if backend == "process" else "/vsimem"
+            dem_index = get_mosaic(dem_index, mosaic_path)
+            mosaic_file = dem_index["files"][0]
+        buffer_pos, dem_pos = dem_index["tree"].query(
+            buffers.geometry.values, predicate="intersects"
+        )
+        tasks_count = len(buffer_pos)
+
+        # CPU and memory budget of the workers and GDAL
+        resources = get_stage_resources(resources, tasks_count, backend)
+
+        # Split buffers of every DEM into chunks of tasks of the workers
+        chunk_size = max(ceil(tasks_count / (resources["workers"] * 4)), 1)
+        chunks = []
+
+        # Cropped windows of all DEM files, keyed by (DEM file name, buffer fid)
+        windows = {}
+
+        for dem_idx, input_file in enumerate(dem_index["files"]):
+            dem_buffers = []
+            for i in sorted(buffer_pos[dem_pos == dem_idx]):
+                buffer_idx, geometry = buffer_geometries[i]
+                if get_buffer_task(input_file, buffer_idx) not in done:
+                    dem_buffers.append((buffer_idx, geometry))
+                    continue
+                window = read_window(cropped_path, input_file, buffer_idx)
+                if window is not None:
+                    windows[(basename(input_file), buffer_idx)] = window
+            for i in range(0, len(dem_buffers), chunk_size):
+                chunks.append(
                     (
                         input_file,
-                        buffer_idx,
-                        cropped_path,
-                        slope_path,
-                        db,
-                        buffers_layer,
-                        crs,
-                        src_nodata,
-                        dst_nodata,
+                        dem_buffers[i : i + chunk_size],
+                        dem_index["nodata"][dem_idx],
                     )
                 )
 
-        # Process buffers in parallel
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            # Submit all tasks and track progress with tqdm
-            futures = {executor.submit(process_buffer, *task): task for task in tasks}
+        # windows are handed over to the next stage as soon as they are cropped
+        dem_order = {input_file: i for i, input_file in enumerate(dem_index["files"])}
+        dem_chunks = Counter(input_file for input_file, _, _ in chunks)
+        if windows_queue is not None:
+            windows_queue.put(("windows", windows))
+            windows = {}
+            for input_file in dem_index["files"]:
+                if dem_chunks[input_file] == 0:
+                    windows_queue.put(("dem", dem_order[input_file], input_file))
+
+        # windows of the process workers are shared through memory-mapped files
+        shared_path = (
+            tempfile.mkdtemp(prefix="windows_") if backend == "process" else None
+        )
 
-            total_processed = 0
-            #with tqdm(total=len(tasks), desc=f"... {basename(input_file)}") as progress:
-            with tqdm(total=len(tasks), desc=f"... {basename(input_file)}", disable=IS_GUI) as progress:
+        # Process chunks of buffers in parallel
+        with get_executor(
+            backend,
+            resources["workers"],
+            initializer=set_gdal_resources,
+            initargs=(resources["gdal_threads"], resources["gdal_cachemax"]),
+        ) as executor:
+            futures = {
+                executor.submit(
+                    process_buffers,
+                    input_file,
+                    chunk,
+                    cropped_path,
+                    slope_path,
+                    projection,
+                    src_nodata,
+                    dst_nodata,
+                    export_rasters,
+                    shared_path,
+                ): (
+                    input_file,
+                    [get_buffer_task(input_file, buffer_idx) for buffer_idx, _ in chunk],
+                )
+                for input_file, chunk, src_nodata in chunks
+            }
+
+            with tqdm(total=tasks_count, initial=tasks_count - sum(len(chunk) for _, chunk, _ in chunks), desc=f"... {len(dem_index['files'])} DEM file(s)", disable=IS_GUI) as progress:
                 for future in concurrent.futures.as_completed(futures):
-                    # Update progress regardless of result
-                    progress.update(1)
+                    input_file, tasks = futures[future]
+                    chunk_windows = future.result()
+                    progress.update(len(tasks))
+                    if journal is not None and export_rasters:
+                        journal.record("dem", tasks)
+
+                    if windows_queue is None:
+                        windows.update(chunk_windows)
+                        continue
+                    windows_queue.put(("windows", chunk_windows))
+                    dem_chunks[input_file] -= 1
+                    if dem_chunks[input_file] == 0:
+                        windows_queue.put(("dem", dem_order[input_file], input_file))
 
-                    # Check if the buffer was processed successfully
-                    if future.result():
-                        total_processed += 1
+        if shared_path is not None and not os.listdir(shared_path):
+            os.rmdir(shared_path)  # No windows to share
+
+        return windows
 
     except Exception as e:
         print("... get_DEM function error")
+        # windows not returned yet are not released by the caller (pipelined
+        # windows are released by the consumer)
+        if shared_path is not None and windows_queue is None:
+            shutil.rmtree(shared_path, ignore_errors=True)
         raise e
+
+    finally:
+        clear_datasets()  # Close the datasets of the serial backend
+        if mosaic_file is not None:
+            gdal.Unlink(mosaic_file)
+        if mosaic_path is not None and mosaic_path != "/vsimem":
+            shutil.rmtree(mosaic_path, ignore_errors=True)
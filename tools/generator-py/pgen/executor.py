@@ -0,0 +1,45 @@
+import multiprocessing
+import concurrent.futures
+
+# executor backends of the parallel stages (the executor parameter)
+EXECUTORS = ["thread", "process", "serial"]
+
+
+class SerialExecutor(concurrent.futures.Executor):
+    """Run tasks one after another in the calling thread (e.g. for debugging)"""
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def get_executor(backend, workers=None, initializer=None, initargs=()):
+    """Executor of the backend: thread pool, process pool or serial execution
+
+    The initializer is called by every worker (once in the calling thread
+    for the serial backend). Worker processes are spawned, not forked: the
+    pools are created while other threads (pipelined stages) may hold GDAL or
+    sqlite locks, which a forked child would inherit locked.
+    """
+    if backend == "thread":
+        return concurrent.futures.ThreadPoolExecutor(
+            workers, initializer=initializer, initargs=initargs
+        )
+    if backend == "process":
+        return concurrent.futures.ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer,
+            initargs=initargs,
+        )
+    if backend == "serial":
+        if initializer is not None:
+            initializer(*initargs)
+        return SerialExecutor()
+    raise Exception(
+        f"... unknown executor backend ({backend}), use one of {EXECUTORS}. Check config.json."
+    )
@@ -4,22 +4,40 @@ import geopandas as gpd
 import shapely.ops
 from os.path import exists, isdir, join, dirname
 from os import makedirs, remove
+from pgen.manifest import STAGES, STAGE_OUTPUTS
 
 
-def init(config):
-    check_paths(config["paths"])
-    read_coastline(config)
-    read_transects(config)
-    ret_val = True
+def init(config, stale=None, resume=False):
+    """Check paths and load inputs, keeping outputs of up to date stages
 
+    A resumed run keeps the outputs (and the database) of the stale stages too.
+    """
+    stale = STAGES if stale is None else stale
+    check_paths(config["paths"], stale, clean=not resume)
+    if "transects" in stale:
+        read_coastline(config)
+        read_transects(config)
 
-def check_paths(config_paths):
+
+def check_paths(config_paths, stale=STAGES, clean=True):
     base = config_paths["base"]
 
     check_base_path(base)
     check_input_path(base, config_paths["input"])
-    check_db_path(base, config_paths["db"])
-    check_output_path(base, config_paths["output"])
+    check_db_path(base, config_paths["db"], clean and "transects" in stale)
+    check_output_path(base, get_stale_outputs(config_paths["output"], stale), clean)
+
+
+def get_stale_outputs(output, stale):
+    """Output paths of the stages to be rebuilt"""
+
+    def _stage(key):
+        for stage, keys in STAGE_OUTPUTS.items():
+            if key in keys:
+                return stage
+        return STAGES[-1]
+
+    return {key: path for key, path in output.items() if _stage(key) in stale}
 
 
 def check_base_path(base):
@@ -53,22 +71,24 @@ def check_input_path(base, input):
             )
 
 
-def check_db_path(base, db):
+def check_db_path(base, db, rebuild=True):
     dbpath = join(base, db)
-    if exists(dbpath):
+    if rebuild and exists(dbpath):
         remove(dbpath)
     dir_name = dirname(dbpath)
     if not exists(dir_name):
         makedirs(dir_name)
 
 
-def check_output_path(base, output):
+def check_output_path(base, output, clean=True):
     paths = list(output.values())
     for path in paths:
         outpath = join(base, path)
         try:
             makedirs(outpath)
         except FileExistsError:
+            if not clean:
+                continue
             files = glob.glob(join(outpath, "*"))
             for file in files:
                 if isdir(file):
@@ -0,0 +1,59 @@
+import sqlite3
+from contextlib import closing
+from os.path import exists, join
+
+# table of the survey db with the finished tasks of the stages
+JOURNAL_TABLE = "journal"
+
+# finished tasks recorded in a single transaction
+JOURNAL_BATCH = 100
+
+
+class Journal:
+    """Append-only journal of the finished tasks of the stages (table of the survey db)
+
+    Tasks are recorded with the inputs hash of their stage (see manifest), so
+    a resumed run skips only the tasks finished with the same inputs. Tasks
+    are identified by name, independently of the order they were finished in.
+    """
+
+    def __init__(self, cfg, hashes, resume=False):
+        self.db = join(cfg["paths"]["base"], cfg["paths"]["db"])
+        self.hashes = hashes
+        self.resume = resume
+
+    def connect(self):
+        connection = sqlite3.connect(self.db, timeout=60)
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {JOURNAL_TABLE} "
+            "(stage TEXT NOT NULL, inputs TEXT NOT NULL, task TEXT NOT NULL)"
+        )
+        return connection
+
+    def start(self, stage):
+        """Tasks of the stage finished before (resumed run), or forget them"""
+        if not exists(self.db):
+            return set()
+
+        with closing(self.connect()) as connection, connection:
+            if not self.resume:
+                connection.execute(
+                    f"DELETE FROM {JOURNAL_TABLE} WHERE stage = ?", (stage,)
+                )
+                return set()
+            rows = connection.execute(
+                f"SELECT task FROM {JOURNAL_TABLE} WHERE stage = ? AND inputs = ?",
+                (stage, self.hashes.get(stage, "")),
+            )
+            return {task for (task,) in rows}
+
+    def record(self, stage, tasks):
+        """Record the finished tasks of the stage"""
+        if not tasks:
+            return
+
+        with closing(self.connect()) as connection, connection:
+            connection.executemany(
+                f"INSERT INTO {JOURNAL_TABLE} VALUES (?, ?, ?)",
+                [(stage, self.hashes.get(stage, ""), task) for task in tasks],
+            )
@@ -0,0 +1,86 @@
+from os.path import join, exists
+from shared.manifest import get_files_state, get_hash
+from shared.manifest import read_manifest, write_manifest, update_manifest
+
+# generator stages in order, every stage depends on the previous one
+STAGES = ["transects", "dem", "profiles"]
+
+# output paths (config keys) cleaned when the stage is rebuilt, the other
+# output paths belong to the last stage
+STAGE_OUTPUTS = {
+    "transects": [],
+    "dem": ["dem_cropped", "dem_slope"],
+}
+
+
+def get_stage_hashes(cfg):
+    """Hash of the inputs (config subset and input files) of every generator stage"""
+    base = cfg["paths"]["base"]
+    inputs = cfg["paths"]["input"]
+    parameters = cfg["parameters"]
+
+    def _parameters(*keys):
+        return {key: parameters[key] for key in keys if key in parameters}
+
+    transect_inputs = [join(base, inputs["coastline"])]
+    if parameters.get("use_precalculated_transects") and "transects" in inputs:
+        transect_inputs.append(join(base, inputs["transects"]))
+
+    transects = get_hash(
+        cfg["crs"],
+        cfg["db_layers"],
+        _parameters(
+            "use_precalculated_transects", "transect_distance", "transect_length"
+        ),
+        get_files_state(transect_inputs),
+    )
+    dem = get_hash(
+        transects,
+        _parameters("buffer_width", "dem_mosaic", "export_dem_rasters"),
+        get_files_state([join(base, inputs["dem"])]),
+    )
+    profiles = get_hash(
+        dem,
+        cfg["csv"],
+        cfg["paths"]["output"],
+        _parameters(
+            "profile_resolution",
+            "sampling_method",
+            "slope_method",
+            "profile_formats",
+        ),
+        get_files_state([join(base, inputs["crop"])]),
+    )
+    return {"transects": transects, "dem": dem, "profiles": profiles}
+
+
+def get_stale_stages(cfg, hashes, force=False):
+    """Generator stages to be rebuilt (inputs changed since the last run)"""
+    base = cfg["paths"]["base"]
+    manifest = {} if force else read_manifest(base)
+
+    # without the database nothing can be reused
+    if not exists(join(base, cfg["paths"]["db"])):
+        manifest = {}
+
+    stale = [stage for stage in STAGES if manifest.get(stage) != hashes[stage]]
+
+    # DEM windows are passed to the profiles in memory unless exported
+    if (
+        "profiles" in stale
+        and "dem" not in stale
+        and not cfg["parameters"].get("export_dem_rasters", False)
+    ):
+        stale = [stage for stage in STAGES if stage in stale or stage == "dem"]
+
+    # forget the stale stages until they are finished
+    if exists(base):
+        write_manifest(
+            base,
+            {
+                stage: stage_hash
+                for stage, stage_hash in manifest.items()
+                if stage not in stale
+            },
+        )
+    return stale
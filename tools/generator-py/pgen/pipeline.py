@@ -0,0 +1,267 @@
+import os
+import queue
+import threading
+import numpy as np
+import geopandas as gpd
+from math import ceil
+from os.path import basename
+from tqdm import tqdm
+import pgen.config as config
+from pgen.dem import get_DEM, get_stage_resources, set_gdal_resources, release_windows
+from pgen.executor import get_executor
+from shared.resources import get_cpus, get_memory
+from pgen.sink import ProfileSpool
+from pgen.profile import process_transects, get_sinks, write_dem_profiles
+
+import sys
+IS_GUI = "--gui" in sys.argv
+
+# chunks of cropped windows waiting for sampling and sampled DEMs waiting for
+# writing, producers block when the queues are full (backpressure)
+WINDOWS_QUEUE_SIZE = 16
+DEMS_QUEUE_SIZE = 2
+
+
+def split_resources(cfg):
+    """Configs of the cropping and the sampling stage sharing the CPU and memory budget"""
+    resources = cfg["resources"] if "resources" in cfg else {}
+    cpus = resources.get("cpus")
+    cpus = get_cpus() if cpus is None or cpus == "auto" else int(cpus)
+    memory = resources.get("memory")
+    memory = get_memory() if memory is None or memory == "auto" else int(memory)
+    crop_cpus = max(cpus // 2, 1)
+    crop_memory = memory // 2
+    return (
+        {**cfg, "resources": {**resources, "cpus": crop_cpus, "memory": crop_memory}},
+        {
+            **cfg,
+            "resources": {
+                **resources,
+                "cpus": max(cpus - crop_cpus, 1),
+                "memory": memory - crop_memory,
+            },
+        },
+    )
+
+
+def crop_dems(cfg, journal, windows_queue, errors):
+    """Producer thread: crop DEM windows into the queue, None when finished"""
+    try:
+        get_DEM(cfg, journal, windows_queue)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        windows_queue.put(None)
+
+
+def write_dems(dems_queue, sinks, cropped_sinks, cropping_buffer, journal, errors):
+    """Writer thread: flush sampled DEMs to the sinks in DEM order, None when finished"""
+    pending = {}
+    next_order = 0
+    while (item := dems_queue.get()) is not None:
+        pending[item[0]] = item
+        while next_order in pending:
+            _, input_file, spool, mono_total = pending.pop(next_order)
+            next_order += 1
+            if spool is None:
+                continue  # DEM finished before the run was interrupted
+            if errors:
+                spool.close()  # keep draining the queue
+                continue
+            try:
+                write_dem_profiles(
+                    input_file,
+                    spool,
+                    mono_total,
+                    sinks,
+                    cropped_sinks,
+                    cropping_buffer,
+                    journal,
+                )
+            except Exception as e:
+                errors.append(e)
+
+
+def new_dem(dem_name):
+    """Spool and running sum of the profiles direction of a DEM"""
+    return {"name": dem_name, "spool": ProfileSpool(), "mono_total": 0}
+
+
+def collect_profiles(future, dem, progress):
+    """Spool the profiles of a finished chunk of transects"""
+    try:
+        results = future.result()
+        for _, profile, mono in results:
+            if profile is not None:
+                dem["spool"].write(profile)
+                dem["mono_total"] += mono
+        progress.update(len(results))
+    except Exception as exc:
+        print(f"Error with transects of {dem['name']}: {exc}")
+
+
+def generate_pipeline(cfg, journal=None, memory_sink=None):
+    """Crop DEM windows, sample and write profiles in overlapping stages
+
+    Transects are sampled as soon as their windows are cropped and DEMs are
+    written (in DEM order) while windows of the next DEMs are still cropped.
+    Outputs are the same as of get_DEM followed by generate_profiles (the
+    memory sink as well).
+    """
+    crop_cfg, sample_cfg = split_resources(cfg)
+    (
+        crs,
+        dem_path,
+        cropped_path,
+        slope_path,
+        profile_path,
+        db,
+        profiles_layer,
+        transects_layer,
+        resolution,
+        slope_method,
+        sampling_method,
+        mosaic,
+        profile_csv,
+        store_path,
+        survey,
+        buffer_path,
+        cropped_profile_path,
+        backend,
+        resources,
+    ) = config.parse(sample_cfg, "generate_profiles")
+
+    try:
+        # Create output directory if needed
+        os.makedirs(profile_path, exist_ok=True)
+
+        transects = gpd.read_file(db, layer=transects_layer)
+        transect_lines = np.asarray(transects.geometry)
+
+        # DEMs finished before the run was interrupted
+        done = journal.start("profiles") if journal is not None else set()
+        sinks, cropped_sinks, cropping_buffer = get_sinks(
+            crs,
+            db,
+            profiles_layer,
+            profile_path,
+            profile_csv,
+            store_path,
+            survey,
+            buffer_path,
+            cropped_profile_path,
+            done,
+            memory_sink,
+        )
+
+        # CPU and memory budget of the sampling workers and GDAL
+        resources = get_stage_resources(resources, len(transect_lines), backend)
+        chunk_size = max(ceil(len(transect_lines) / (resources["workers"] * 4)), 1)
+
+        errors = []
+        windows_queue = queue.Queue(WINDOWS_QUEUE_SIZE)
+        dems_queue = queue.Queue(DEMS_QUEUE_SIZE)
+        producer = threading.Thread(
+            target=crop_dems,
+            args=(crop_cfg, journal, windows_queue, errors),
+            daemon=True,
+        )
+        writer = threading.Thread(
+            target=write_dems,
+            args=(dems_queue, sinks, cropped_sinks, cropping_buffer, journal, errors),
+            daemon=True,
+        )
+        producer.start()
+        writer.start()
+
+        dems = {}  # DEM name => spool and running sum of the profiles direction
+        futures = {}  # chunk of transects => DEM
+        shared_windows = {}  # references of memory-mapped windows
+
+        finished = False
+        try:
+            with get_executor(
+                backend,
+                resources["workers"],
+                initializer=set_gdal_resources,
+                initargs=(resources["gdal_threads"], resources["gdal_cachemax"]),
+            ) as executor, tqdm(desc="... profiles", disable=IS_GUI) as progress:
+                while (item := windows_queue.get()) is not None:
+                    # spool chunks finished in the meantime
+                    for future in [future for future in futures if future.done()]:
+                        collect_profiles(future, futures.pop(future), progress)
+
+                    if item[0] == "windows":
+                        dem_transects = {}
+                        for (dem_name, buffer_idx), window in sorted(item[1].items()):
+                            if dem_name in done:
+                                continue
+                            if "file" in window:
+                                shared_windows[(dem_name, buffer_idx)] = window
+                            dem_transects.setdefault(dem_name, []).append(
+                                (buffer_idx - 1, transect_lines[buffer_idx - 1], window)
+                            )
+
+                        for dem_name, batch in dem_transects.items():
+                            if dem_name not in dems:
+                                dems[dem_name] = new_dem(dem_name)
+                            dem = dems[dem_name]
+                            for i in range(0, len(batch), chunk_size):
+                                future = executor.submit(
+                                    process_transects,
+                                    dem_name,
+                                    batch[i : i + chunk_size],
+                                    False,
+                                    cropped_path,
+                                    resolution,
+                                    slope_method,
+                                    sampling_method,
+                                )
+                                futures[future] = dem
+                        continue
+
+                    # all windows of the DEM are cropped, wait for its profiles
+                    _, order, input_file = item
+                    dem_name = basename(input_file)
+                    if dem_name in done:
+                        dems_queue.put((order, input_file, None, 0))
+                        continue
+
+                    dem = dems.pop(dem_name) if dem_name in dems else new_dem(dem_name)
+                    for future in [f for f in futures if futures[f] is dem]:
+                        collect_profiles(future, futures.pop(future), progress)
+                    dems_queue.put((order, input_file, dem["spool"], dem["mono_total"]))
+            finished = True
+
+        finally:
+            if not finished:
+                # the loop failed: drain the windows queue so that the producer
+                # (blocked on the full queue) can exit, drained windows are released too
+                while (item := windows_queue.get()) is not None:
+                    if item[0] == "windows":
+                        shared_windows.update(
+                            (key, window)
+                            for key, window in item[1].items()
+                            if "file" in window
+                        )
+                # spools of the DEMs never handed to the writer
+                for dem in dems.values():
+                    dem["spool"].close()
+
+            dems_queue.put(None)
+            writer.join()
+            producer.join()
+            for sink in sinks + cropped_sinks:
+                try:
+                    sink.shutdown()
+                except Exception as e:
+                    errors.append(e)  # raised unless the loop failed
+            # memory-mapped window files are removed when profiling fails too
+            release_windows(shared_windows)
+
+        if errors:
+            raise errors[0]
+
+    except Exception as e:
+        print("... generate_pipeline function error")
+        raise e
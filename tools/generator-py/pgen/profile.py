@@ -3,10 +3,15 @@ import numpy as np
 import pandas as pd
 import geopandas as gpd
 import shapely
-from osgeo import gdal
-from os.path import join, basename
-from math import floor
+from os.path import join, basename, exists
+from math import ceil, floor
 import pgen.config as config
+from pgen.dem import read_window, attach_window, horn_slope, MOSAIC_NAME
+from pgen.dem import get_stage_resources, set_gdal_resources
+from shared.store import write_profiles, read_profiles
+from pgen.sink import ProfileSpool, CsvSink, StoreSink, GpkgSink, AsyncSink
+from pgen.journal import JOURNAL_BATCH
+from pgen.executor import get_executor
 import concurrent.futures
 import os
 from tqdm import tqdm
@@ -27,61 +32,145 @@ def reverse_geom(geom):
     return shapely.ops.transform(_reverse, geom)
 
 
+def profile_gradient(elevation, resolution, nodata, slope_nodata=-9999):
+    """Slope in degrees along the profile (central differences of the samples)"""
+    elevation = np.asarray(elevation, dtype=np.float64)
+    if len(elevation) < 2:
+        return np.full(len(elevation), slope_nodata, dtype=np.float64)
+
+    if nodata is not None:
+        elevation = np.where(elevation == nodata, np.nan, elevation)
+    slope = np.degrees(np.arctan(np.abs(np.gradient(elevation, resolution))))
+    return np.where(np.isnan(slope), slope_nodata, slope)
+
+
+def sample_transect(line, line_length, resolution):
+    """Distances and coordinates of all samples of the transect"""
+    dist = np.arange(0, line_length, resolution)
+    if shapely.get_num_coordinates(line) == 2:
+        # straight transect - parametric form of the segment
+        (x0, y0), (x1, y1) = shapely.get_coordinates(line)
+        t = np.minimum(dist / line.length, 1)
+        return dist, x0 + t * (x1 - x0), y0 + t * (y1 - y0)
+
+    points = shapely.line_interpolate_point(line, dist)
+    return dist, shapely.get_x(points), shapely.get_y(points)
+
+
+def get_pixels(x, y, geotransform, shape):
+    """Rows and columns of the coordinates and a mask of those inside the raster"""
+    rows = np.floor((y - geotransform[3]) / geotransform[5]).astype(np.int64)
+    cols = np.floor((x - geotransform[0]) / geotransform[1]).astype(np.int64)
+    inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+    return rows, cols, inside
+
+
+def cubic_weights(t, a=-0.5):
+    """Weights of the cubic convolution kernel (Keys, as GDAL cubic resampling)"""
+    t = np.abs(t)
+    return np.where(
+        t <= 1,
+        (a + 2) * t**3 - (a + 3) * t**2 + 1,
+        np.where(t < 2, a * t**3 - 5 * a * t**2 + 8 * a * t - 4 * a, 0),
+    )
+
+
+def sample_raster(array, x, y, geotransform, nodata, method="nearest"):
+    """Values of the raster at all x/y coordinates at once
+
+    The method is nearest, bilinear or cubic. Interpolated samples that need
+    pixels outside of the raster or nodata pixels fall back to the nearest
+    pixel, samples outside of the raster are nodata (NaN without nodata).
+    """
+    rows, cols, inside = get_pixels(x, y, geotransform, array.shape)
+    values = np.full(len(rows), np.nan if nodata is None else nodata, dtype=np.float64)
+    values[inside] = array[rows[inside], cols[inside]]
+    if method == "nearest":
+        return values
+
+    # position relative to the pixel centers
+    fr = (y - geotransform[3]) / geotransform[5] - 0.5
+    fc = (x - geotransform[0]) / geotransform[1] - 0.5
+    r0 = np.floor(fr).astype(np.int64)
+    c0 = np.floor(fc).astype(np.int64)
+    dr = fr - r0
+    dc = fc - c0
+
+    if method == "bilinear":
+        offsets = np.arange(0, 2)
+        wr = np.stack([1 - dr, dr])
+        wc = np.stack([1 - dc, dc])
+    elif method == "cubic":
+        offsets = np.arange(-1, 3)
+        wr = cubic_weights(dr[None, :] - offsets[:, None])
+        wc = cubic_weights(dc[None, :] - offsets[:, None])
+    else:
+        raise Exception(f"... unknown sampling method ({method}).")
+
+    # (kernel rows, kernel cols, samples) neighbourhoods of all samples
+    rr = r0[None, :] + offsets[:, None]
+    cc = c0[None, :] + offsets[:, None]
+    valid = (
+        ((rr >= 0) & (rr < array.shape[0])).all(axis=0)
+        & ((cc >= 0) & (cc < array.shape[1])).all(axis=0)
+    )
+    neighbours = array[
+        np.clip(rr, 0, array.shape[0] - 1)[:, None, :],
+        np.clip(cc, 0, array.shape[1] - 1)[None, :, :],
+    ].astype(np.float64)
+    valid &= ~np.isnan(neighbours).any(axis=(0, 1))
+    if nodata is not None:
+        valid &= ~(neighbours == nodata).any(axis=(0, 1))
+
+    interpolated = (wr[:, None, :] * wc[None, :, :] * neighbours).sum(axis=(0, 1))
+    return np.where(valid, interpolated, values)
+
+
 def process_transect(
     input_file,
     transect_idx,
     transect_line,
     reverse,
-    cropped_path,
-    slope_path,
+    window,
     resolution,
+    slope_method="raster",
+    sampling_method="nearest",
 ):
-    """Process a single transect for a DEM file"""
+    """Process a single transect for a DEM file window"""
     profile = pd.DataFrame()
-    cropped_file = join(cropped_path, f"{transect_idx + 1}_crop_{basename(input_file)}")
-    slope_file = join(slope_path, f"{transect_idx + 1}_slope_{basename(input_file)}")
-
-    height_raster = gdal.Open(cropped_file)
-    slope_raster = gdal.Open(slope_file)
 
-    if height_raster is None or slope_raster is None:
+    if window is None:
         return None, 0
 
     try:
-        height_array = height_raster.GetRasterBand(1).ReadAsArray()
-        slope_array = slope_raster.GetRasterBand(1).ReadAsArray()
-        height_nodata = height_raster.GetRasterBand(1).GetNoDataValue()
+        height_array = window["elevation"]
+        height_nodata = window["nodata"]
 
-        env = height_raster.GetGeoTransform()
-        x_origin = env[0]
-        y_origin = env[3]
-        pixel_width = env[1]
-        pixel_height = -env[5]
+        env = window["geotransform"]
 
         line = transect_line
         line_length = round(line.length, 2)
         if reverse:
             line = reverse_geom(line)
 
-        current_dist = 0
-        x, y, dist, elevation, slope, xg, yg = [], [], [], [], [], [], []
-
-        while current_dist < line_length:
-            dist.append(current_dist)
-            point = line.interpolate(current_dist)
-            col = int((point.x - x_origin) / pixel_width)
-            row = int((y_origin - point.y) / pixel_height)
-            x_geo = point.x
-            y_geo = point.y
-            elevation.append(height_array[row][col])
-            slope.append(slope_array[row][col])
-            x.append(int(row))
-            y.append(int(col))
-            xg.append(float(x_geo))
-            yg.append(float(y_geo))
-            current_dist += resolution
-
-        elevation = list(map(lambda i: 0 if i == height_nodata else i, elevation))
+        dist, x_geo, y_geo = sample_transect(line, line_length, resolution)
+        rows, cols, _ = get_pixels(x_geo, y_geo, env, height_array.shape)
+
+        # samples outside of the window are masked as nodata
+        elevation = sample_raster(
+            height_array, x_geo, y_geo, env, height_nodata, sampling_method
+        )
+        if height_nodata is not None:
+            nodata = elevation == height_nodata
+        else:
+            nodata = np.isnan(elevation)
+
+        if slope_method == "profile":
+            slope = profile_gradient(elevation, resolution, height_nodata)
+        else:
+            slope = horn_slope(height_array, rows, cols, env, height_nodata)
+
+        elevation[nodata] = 0
 
         no_point = np.arange(len(elevation))
         profile = pd.DataFrame(
@@ -90,45 +179,159 @@ def process_transect(
                 "length_transect": line_length,
                 "no_point": no_point,
                 "dem": basename(input_file),
-                "x_image": x,
-                "y_image": y,
-                "x_geo": xg,
-                "y_geo": yg,
-                "elevation": [round(num, 2) for num in elevation],
-                "slope": [round(num, 2) for num in slope],
+                "x_image": rows,
+                "y_image": cols,
+                "x_geo": x_geo,
+                "y_geo": y_geo,
+                "elevation": np.round(elevation, 2),
+                "slope": np.round(slope, 2),
             },
             index=line_length * transect_idx + no_point + 1,
         )
 
-        # Calculate mono for this transect
+        # Calculate mono for this transect (elevation change between the first
+        # and the last point above zero)
         mono = 0
-        if len(profile[profile.elevation > 0].index) > 0:
+        above_zero = np.flatnonzero(profile.elevation.values > 0)
+        if len(above_zero) > 0:
             mono = (
-                profile.elevation[
-                    profile[profile.elevation > 0]
-                    .index[0] : profile[profile.elevation > 0]
-                    .index[-1]
-                ]
-                .diff()
-                .sum()
+                profile.elevation.values[above_zero[-1]]
+                - profile.elevation.values[above_zero[0]]
             )
 
-        # Clean up resources
-        height_raster = None
-        slope_raster = None
-
         return profile, mono
 
     except Exception as e:
-        if height_raster is not None:
-            height_raster = None
-        if slope_raster is not None:
-            slope_raster = None
         print(f"Error processing transect {transect_idx+1}: {str(e)}")
         return None, 0
 
 
-def generate_profiles(cfg):
+def reverse_profile(profile):
+    """Reverse the direction of the profile (point numbers and index)"""
+    profile.no_point = 1 + max(profile.no_point) + profile.no_point.__invert__()
+    profile.index = list(
+        range(int(max(profile.index)), int(min(profile.index)) - 1, -1)
+    )
+    return profile.sort_index()
+
+
+def process_transects(
+    input_file,
+    transects,
+    reverse,
+    cropped_path,
+    resolution,
+    slope_method,
+    sampling_method,
+):
+    """Process a chunk of transects (index, line, window) for a DEM file
+
+    Transects without a window use the rasters exported by get_DEM, shared
+    windows are attached without copying.
+    """
+    results = []
+    for transect_idx, transect_line, window in transects:
+        if window is None:
+            window = read_window(cropped_path, input_file, transect_idx + 1)
+        else:
+            window = attach_window(window)
+        profile, mono = process_transect(
+            input_file,
+            transect_idx,
+            transect_line,
+            reverse,
+            window,
+            resolution,
+            slope_method,
+            sampling_method,
+        )
+        results.append((transect_idx, profile, mono))
+    return results
+
+
+def get_sinks(
+    crs,
+    db,
+    profiles_layer,
+    profile_path,
+    profile_csv,
+    store_path,
+    survey,
+    buffer_path,
+    cropped_profile_path,
+    done,
+    memory_sink=None,
+):
+    """Sinks of the whole and of the cropped profiles, and the cropping polygons
+
+    Every sink is written by its own background thread (shut them down at the end).
+    The memory sink keeps the cropped profiles (the whole ones without cropping
+    polygons).
+    """
+    # profiles are flushed to the sinks transect by transect
+    sinks = [GpkgSink(db, profiles_layer, crs, keep=done)]
+    if profile_csv["export"]:
+        sinks.append(CsvSink(profile_path, profile_csv))
+    if store_path is not None:
+        sinks.append(StoreSink(join(store_path, "whole"), survey))
+
+    # profiles are cropped in memory, before they are flushed
+    cropped_sinks = []
+    cropping_buffer = get_cropping_buffer(crs, buffer_path)
+    if cropping_buffer is None:
+        print("No buffer files found in the specified path")
+    else:
+        if profile_csv["export"]:
+            os.makedirs(cropped_profile_path, exist_ok=True)
+            cropped_sinks.append(
+                CsvSink(cropped_profile_path, profile_csv, kind="crop")
+            )
+        if store_path is not None:
+            cropped_sinks.append(StoreSink(join(store_path, "cropped"), survey))
+
+    if memory_sink is not None:
+        (sinks if cropping_buffer is None else cropped_sinks).append(memory_sink)
+
+    return (
+        [AsyncSink(sink) for sink in sinks],
+        [AsyncSink(sink) for sink in cropped_sinks],
+        cropping_buffer,
+    )
+
+
+def write_dem_profiles(
+    input_file, spool, mono_total, sinks, cropped_sinks, cropping_buffer, journal
+):
+    """Flush the spooled profiles of a DEM to the sinks and journal the DEM"""
+    # profiles are final (direction known), flush them in transect order
+    try:
+        for profile in spool:
+            if mono_total < 0:
+                profile = reverse_profile(profile)
+            for sink in sinks:
+                sink.write(profile)
+            if cropped_sinks:
+                cropped_profile = crop_profile(profile, cropping_buffer)
+                for sink in cropped_sinks:
+                    sink.write(cropped_profile)
+    finally:
+        spool.close()
+
+    # all profiles of the DEM are written, the DEM is finished
+    for sink in sinks + cropped_sinks:
+        sink.close()
+    if journal is not None:
+        journal.record("profiles", [basename(input_file)])
+
+
+def generate_profiles(cfg, windows=None, journal=None, memory_sink=None):
+    """Generate profiles from the DEM windows returned by get_DEM
+
+    Without windows (e.g. when run standalone) the windows are read from the
+    rasters exported by get_DEM (the export_dem_rasters parameter). DEMs are
+    journaled once all their profiles are flushed to the sinks. With a memory
+    sink (MemorySink) the profiles are kept in memory too.
+    """
     (
         crs,
         dem_path,
@@ -139,7 +342,16 @@ def generate_profiles(cfg):
         profiles_layer,
         transects_layer,
         resolution,
+        slope_method,
+        sampling_method,
+        mosaic,
         profile_csv,
+        store_path,
+        survey,
+        buffer_path,
+        cropped_profile_path,
+        backend,
+        resources,
     ) = config.parse(cfg, generate_profiles.__name__)
 
     try:
@@ -155,112 +367,159 @@ def generate_profiles(cfg):
         transects_count = transects.id.count()
         transect_lines = np.asarray(transects.geometry)
 
-        all_profiles = pd.DataFrame()
+        # tiles of the mosaic are profiled as a single DEM
+        if mosaic:
+            dem_input_files = [MOSAIC_NAME]
+
+        # CPU and memory budget of the workers and GDAL
+        resources = get_stage_resources(resources, transects_count, backend)
+
+        # DEMs finished before the run was interrupted
+        done = journal.start("profiles") if journal is not None else set()
+
+        sinks, cropped_sinks, cropping_buffer = get_sinks(
+            crs,
+            db,
+            profiles_layer,
+            profile_path,
+            profile_csv,
+            store_path,
+            survey,
+            buffer_path,
+            cropped_profile_path,
+            done,
+            memory_sink,
+        )
 
         for input_file in dem_input_files:
-            profiles_for_dem = pd.DataFrame()
+            if basename(input_file) in done:
+                continue
 
             reverse = False
 
+            # running sum of the profiles direction
             mono_total = 0
-            results = []
-
-            # Process transects in parallel
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future_to_transect = {
-                    executor.submit(
-                        process_transect,
-                        input_file,
-                        idx,
-                        transect_lines[idx],
-                        reverse,
-                        cropped_path,
-                        slope_path,
-                        resolution,
-                    ): idx
+            spool = ProfileSpool()
+            try:
+                # transects with windows of the DEM (read from disk without windows)
+                dem_transects = [
+                    (idx, transect_lines[idx], None)
+                    if windows is None
+                    else (idx, transect_lines[idx], windows[(basename(input_file), idx + 1)])
                     for idx in range(transects_count)
-                }
-
-                # Use tqdm to show progress
-                for future in tqdm(
-                    concurrent.futures.as_completed(future_to_transect),
-                    total=transects_count,
-                    desc=f"... {basename(input_file)}"
-                    + (" (reversed)" if reverse else ""),
-                    disable=IS_GUI
-                ):
-                    transect_idx = future_to_transect[future]
-                    try:
-                        profile, mono = future.result()
-                        if profile is not None:
-                            results.append(profile)
-                            mono_total += mono
-                    except Exception as exc:
-                        print(f"Error with transect {transect_idx+1}: {exc}")
-
-            if mono_total < 0:
-                # reverse
-                for result in results:
-                    result.no_point = (
-                        1 + max(result.no_point) + result.no_point.__invert__()
-                    )
-                    result.index = list(
-                        range(int(max(result.index)), int(min(result.index)) - 1, -1)
-                    )
-
-            profiles_for_dem = pd.concat(results, ignore_index=False).sort_index()
-
-            all_profiles = pd.concat(
-                [all_profiles, profiles_for_dem], ignore_index=False
-            )
-
-        # Save all profiles to separate CSV files
-        grouped = all_profiles.groupby(["no_transect", "dem"])
-        for (transect_idx, dem_name), profile_df in grouped:
-            # Create filename based on transect number and DEM name
-            csv_filename = join(profile_path, f"{int(transect_idx)}_whole_{dem_name}")
-
-            # Make sure the filename has .csv extension
-            if not csv_filename.endswith(".csv"):
-                csv_filename = csv_filename.replace(".tif", ".csv")
-
-            # Save to CSV with specified settings
-            profile_df.to_csv(
-                csv_filename,
-                sep=profile_csv["sep"],
-                encoding=profile_csv["encoding"],
-                index=False,
-            )
+                    if windows is None or (basename(input_file), idx + 1) in windows
+                ]
+                chunk_size = max(
+                    ceil(len(dem_transects) / (resources["workers"] * 4)), 1
+                )
+
+                # Process chunks of transects in parallel
+                with get_executor(
+                    backend,
+                    resources["workers"],
+                    initializer=set_gdal_resources,
+                    initargs=(resources["gdal_threads"], resources["gdal_cachemax"]),
+                ) as executor:
+                    future_to_chunk = {
+                        executor.submit(
+                            process_transects,
+                            input_file,
+                            dem_transects[i : i + chunk_size],
+                            reverse,
+                            cropped_path,
+                            resolution,
+                            slope_method,
+                            sampling_method,
+                        ): dem_transects[i : i + chunk_size]
+                        for i in range(0, len(dem_transects), chunk_size)
+                    }
+
+                    # Use tqdm to show progress
+                    with tqdm(
+                        total=len(dem_transects),
+                        desc=f"... {basename(input_file)}"
+                        + (" (reversed)" if reverse else ""),
+                        disable=IS_GUI,
+                    ) as progress:
+                        for future in concurrent.futures.as_completed(future_to_chunk):
+                            chunk = future_to_chunk[future]
+                            progress.update(len(chunk))
+                            try:
+                                for _, profile, mono in future.result():
+                                    if profile is not None:
+                                        spool.write(profile)
+                                        mono_total += mono
+                            except Exception as exc:
+                                print(
+                                    f"Error with transects {chunk[0][0]+1}-{chunk[-1][0]+1}: {exc}"
+                                )
+
+                write_dem_profiles(
+                    input_file,
+                    spool,
+                    mono_total,
+                    sinks,
+                    cropped_sinks,
+                    cropping_buffer,
+                    journal,
+                )
+            finally:
+                spool.close()  # removed already unless the DEM failed
 
-        # Save all profiles to GeoPackage
-        if not all_profiles.empty:
-            gpd.GeoDataFrame(
-                all_profiles,
-                geometry=gpd.points_from_xy(all_profiles.x_geo, all_profiles.y_geo),
-            ).set_crs(crs).to_file(
-                db, layer=profiles_layer, driver="GPKG", overwrite="yes"
-            )
+        for sink in sinks + cropped_sinks:
+            sink.shutdown()
 
     except Exception as e:
         print("... generate_profiles function error")
         raise e
 
 
+def get_cropping_buffer(crs, buffer_path):
+    """Cropping polygons (prepared for point-in-polygon tests)"""
+    buffers = glob.glob(join(buffer_path, "*.shp"))
+    if not buffers:
+        return None
+
+    cropping_buffer = gpd.read_file(buffers[0]).to_crs(crs)
+    cropping_buffer.id = 1  # change id
+    shapely.prepare(np.asarray(cropping_buffer.geometry))
+    return cropping_buffer
+
+
+def crop_profile(profile, cropping_buffer):
+    """Join the profile points with the cropping polygons containing them
+
+    Vectorized equivalent of gpd.sjoin(predicate="within", how="left"): adds
+    the index_right column and the polygon attributes (e.g. id), NaN outside.
+    """
+    x = profile.x_geo.values
+    y = profile.y_geo.values
+    position = np.full(len(profile), -1)
+    for idx, geometry in enumerate(cropping_buffer.geometry.values):
+        position[(position < 0) & shapely.contains_xy(geometry, x, y)] = idx
+
+    inside = position >= 0
+    cropped = profile.copy()
+    cropped["index_right"] = pd.Series(
+        cropping_buffer.index.values[position.clip(0)], index=profile.index
+    ).where(inside)
+    attributes = pd.DataFrame(
+        cropping_buffer.drop(columns=cropping_buffer.geometry.name)
+    )
+    for column in attributes.columns:
+        cropped[column] = pd.Series(
+            attributes[column].values[position.clip(0)], index=profile.index
+        ).where(inside)
+    return cropped
+
+
 def process_single_profile(
     crs, source_file, cropping_buffer, in_profile_csv, out_profile_path, out_profile_csv
 ):
     """Process a single profile file for cropping"""
     try:
         csv_profile = pd.read_csv(source_file, sep=in_profile_csv["sep"])
-        profile = gpd.GeoDataFrame(
-            csv_profile,
-            geometry=gpd.points_from_xy(csv_profile.x_geo, csv_profile.y_geo),
-        ).set_crs(crs)
-
-        cropped_profile = gpd.sjoin(
-            profile, cropping_buffer, predicate="within", how="left"
-        )
-        cropped_profile = cropped_profile.to_crs(crs)
+        cropped_profile = crop_profile(csv_profile, cropping_buffer)
 
         output_file = join(
             out_profile_path, basename(source_file).replace("whole", "crop")
@@ -277,33 +536,63 @@ def process_single_profile(
         return False
 
 
-def crop_profiles(cfg):
+def crop_store_profiles(crs, store_path, survey, cropping_buffer):
+    """Crop the whole profiles of the survey in the columnar store"""
+    if not exists(join(store_path, "whole")):
+        print("No profiles found in the profile store")
+        return
+
+    whole_profiles = read_profiles(join(store_path, "whole"), survey=survey)
+    if whole_profiles.empty:
+        print("No profiles found in the profile store")
+        return
+
+    write_profiles(
+        join(store_path, "cropped"),
+        crop_profile(whole_profiles.drop(columns="survey"), cropping_buffer),
+        survey,
+    )
+
+
+def crop_profiles(cfg, journal=None):
     (
         crs,
         buffer_path,
         in_profile_path,
         out_profile_path,
         profile_csv,
+        store_path,
+        survey,
     ) = config.parse(cfg, crop_profiles.__name__)
 
     try:
         # Create output directory if it doesn't exist
         os.makedirs(out_profile_path, exist_ok=True)
 
-        # Load buffers
-        buffers = glob.glob(join(buffer_path, "*.shp"))
-        if not buffers:
+        cropping_buffer = get_cropping_buffer(crs, buffer_path)
+        if cropping_buffer is None:
             print("No buffer files found in the specified path")
             return
 
-        cropping_buffer = gpd.read_file(buffers[0]).to_crs(crs)
-        cropping_buffer.id = 1  # change id
+        # profile files (and the store) cropped before the run was interrupted
+        done = journal.start("crop") if journal is not None else set()
+
+        # Crop all profiles of the columnar store at once
+        if store_path is not None and "store" not in done:
+            crop_store_profiles(crs, store_path, survey, cropping_buffer)
+            if journal is not None:
+                journal.record("crop", ["store"])
+
+        if not profile_csv["export"]:
+            return
 
         # Get profile files
         profile_files = glob.glob(join(in_profile_path, "*.csv"))
         if not profile_files:
             print("No profile files found in the specified path")
             return
+        cropped_count = len(profile_files)
+        profile_files = [file for file in profile_files if basename(file) not in done]
 
         # Process files in parallel
         with concurrent.futures.ThreadPoolExecutor() as executor:
@@ -323,18 +612,28 @@ def crop_profiles(cfg):
 
             # Use tqdm to show progress
             success_count = 0
-            with tqdm(total=len(profile_files), desc=f"... all profiles", disable=IS_GUI) as pbar:
+            finished = []
+            with tqdm(total=cropped_count, initial=cropped_count - len(profile_files), desc=f"... all profiles", disable=IS_GUI) as pbar:
                 for future in concurrent.futures.as_completed(future_to_file):
                     source_file = future_to_file[future]
                     try:
                         if future.result():
                             success_count += 1
+                            finished.append(basename(source_file))
                     except Exception as exc:
                         print(
                             f"Processing of {basename(source_file)} generated an exception: {exc}"
                         )
                     pbar.update(1)  # Update the progress bar
 
+                    # journal finished files in batches
+                    if journal is not None and len(finished) >= JOURNAL_BATCH:
+                        journal.record("crop", finished)
+                        finished = []
+
+            if journal is not None:
+                journal.record("crop", finished)
+
     except Exception as e:
         print("... crop_profiles function error")
         raise e
@@ -0,0 +1,42 @@
+from shared.resources import get_cpus, get_memory
+
+# share of the memory budget for the GDAL block cache (of all processes)
+GDAL_CACHE_SHARE = 0.25
+
+# minimum GDAL block cache of a process (MB)
+GDAL_CACHE_MIN = 16
+
+
+def _value(value, auto):
+    return auto if value is None or value == "auto" else int(value)
+
+
+def get_resources(resources, tasks, backend):
+    """Split the CPU and memory budget between the workers and GDAL
+
+    resources: budget (cpus, memory in MB) and optional fixed values (workers,
+    gdal_threads, gdal_cachemax in MB), "auto" or missing values are picked from
+    the machine and the number of tasks.
+    """
+    cpus = _value(resources.get("cpus"), get_cpus())
+    memory = _value(resources.get("memory"), get_memory())
+
+    workers = (
+        1
+        if backend == "serial"
+        else _value(resources.get("workers"), max(min(cpus, tasks), 1))
+    )
+    # GDAL threads of every worker use the CPUs left by the workers
+    gdal_threads = _value(resources.get("gdal_threads"), max(cpus // workers, 1))
+    # every process has its own GDAL block cache
+    processes = workers if backend == "process" else 1
+    gdal_cachemax = _value(
+        resources.get("gdal_cachemax"),
+        max(int(memory * GDAL_CACHE_SHARE / processes), GDAL_CACHE_MIN),
+    )
+
+    return {
+        "workers": workers,
+        "gdal_threads": gdal_threads,
+        "gdal_cachemax": gdal_cachemax,
+    }
@@ -0,0 +1,238 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from contextlib import closing
+from os.path import join, splitext
+from shared.writer import AsyncWriter
+
+# rows buffered by the sinks before a chunk is written
+CHUNK_ROWS = 100000
+
+
+class ProfileSpool:
+    """Temporary on-disk (Arrow IPC) spool of the transect profiles of one DEM
+
+    Profiles are spooled in completion order and read back one at a time in
+    transect order, so only a single profile has to be kept in memory.
+    """
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(suffix=".arrow")
+        os.close(fd)  # the file is reopened by the Arrow writer
+        self.writer = None
+        self.batches = {}  # transect number => batch number
+
+    def write(self, profile):
+        batch = pa.RecordBatch.from_pandas(profile, preserve_index=True)
+        if self.writer is None:
+            self.writer = pa.ipc.new_file(self.path, batch.schema)
+        self.writer.write_batch(batch)
+        self.batches[int(profile.no_transect.iloc[0])] = len(self.batches)
+
+    def __iter__(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.writer = None
+        with pa.memory_map(self.path) as source:
+            reader = pa.ipc.open_file(source)
+            for transect in sorted(self.batches):
+                yield reader.get_batch(self.batches[transect]).to_pandas()
+
+    def __len__(self):
+        return len(self.batches)
+
+    def close(self):
+        """Remove the spool file (closing it more than once is harmless)"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CsvSink:
+    """One CSV file per transect and DEM ({transect}_{kind}_{dem}.csv)"""
+
+    def __init__(self, profile_path, profile_csv, kind="whole"):
+        self.profile_path = profile_path
+        self.profile_csv = profile_csv
+        self.kind = kind
+
+    def write(self, profile):
+        csv_filename = join(
+            self.profile_path,
+            f"{int(profile.no_transect.iloc[0])}_{self.kind}_"
+            f"{splitext(profile.dem.iloc[0])[0]}.csv",
+        )
+        profile.to_csv(
+            csv_filename,
+            sep=self.profile_csv["sep"],
+            encoding=self.profile_csv["encoding"],
+            index=False,
+        )
+
+    def close(self):
+        pass
+
+
+class StoreSink:
+    """Profile store partitions (survey and DEM), written in row groups of chunks
+
+    Profiles have to be written in transect order (one DEM after another).
+    """
+
+    def __init__(self, store_path, survey):
+        self.store_path = store_path
+        self.survey = survey
+        self.dem = None
+        self.writer = None
+        self.chunk = []
+        self.rows = 0
+
+    def write(self, profile):
+        dem = profile.dem.iloc[0]
+        if dem != self.dem:
+            self.close()
+            self.dem = dem
+
+        self.chunk.append(profile)
+        self.rows += len(profile)
+        if self.rows >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.chunk:
+            return
+
+        table = pa.Table.from_pandas(
+            pd.concat(self.chunk).drop(columns=["dem", "survey"], errors="ignore"),
+            preserve_index=False,
+        )
+        if self.writer is None:
+            # replace the partition of the survey DEM
+            partition = join(self.store_path, f"survey={self.survey}", f"dem={self.dem}")
+            shutil.rmtree(partition, ignore_errors=True)
+            os.makedirs(partition)
+            self.writer = pq.ParquetWriter(join(partition, "part-0.parquet"), table.schema)
+        else:
+            # e.g. columns without missing values in the first chunk
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+        self.chunk = []
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class MemorySink:
+    """Profiles kept in memory, e.g. handed to the finder without the profile files"""
+
+    def __init__(self):
+        self.chunk = []
+
+    def write(self, profile):
+        self.chunk.append(profile)
+
+    def close(self):
+        pass
+
+    def get_profiles(self):
+        """Profiles of all DEMs, sorted as read from the profile store"""
+        if not self.chunk:
+            return pd.DataFrame()
+        profiles = pd.concat(self.chunk, ignore_index=True)
+        profiles["dem"] = profiles["dem"].astype(str)
+        return profiles.sort_values(["no_transect", "dem", "no_point"], ignore_index=True)
+
+
+def keep_profiles(db, layer, dems):
+    """Delete points of the layer not belonging to the DEMs (e.g. of an interrupted run)
+
+    Returns False when there is no layer to keep.
+    """
+    with closing(sqlite3.connect(db, timeout=60)) as connection, connection:
+        exists = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (layer,)
+        ).fetchone()
+        if exists is None:
+            return False
+        connection.execute(
+            f'DELETE FROM "{layer}" WHERE dem NOT IN ({", ".join("?" * len(dems))})',
+            list(dems),
+        )
+    return True
+
+
+class GpkgSink:
+    """GeoPackage layer of profile points, written in chunks
+
+    With keep (DEM names of a resumed run) points of these DEMs are kept and
+    the other profiles are appended.
+    """
+
+    def __init__(self, db, layer, crs, keep=None):
+        self.db = db
+        self.layer = layer
+        self.crs = crs
+        self.mode = "a" if keep and keep_profiles(db, layer, keep) else "w"
+        self.chunk = []
+        self.rows = 0
+
+    def write(self, profile):
+        self.chunk.append(profile)
+        self.rows += len(profile)
+        if self.rows >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.chunk:
+            return
+
+        profiles = pd.concat(self.chunk)
+        options = {"overwrite": "yes"} if self.mode == "w" else {}
+        gpd.GeoDataFrame(
+            profiles,
+            geometry=gpd.points_from_xy(profiles.x_geo, profiles.y_geo),
+        ).set_crs(self.crs).to_file(
+            self.db, layer=self.layer, driver="GPKG", mode=self.mode, **options
+        )
+        self.mode = "a"
+        self.chunk = []
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+
+
+class AsyncSink:
+    """Sink written in order by its own background thread
+
+    Writes overlap with the computation of the next profiles, close() is a
+    barrier: all profiles are written and the sink is closed (it can be used
+    again), shutdown() stops the thread.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.writer = AsyncWriter()
+
+    def write(self, profile):
+        self.writer.submit(self.sink.write, profile)
+
+    def close(self):
+        self.writer.submit(self.sink.close)
+        self.writer.flush()
+
+    def shutdown(self):
+        self.close()
+        self.writer.close()
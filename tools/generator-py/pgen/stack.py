@@ -0,0 +1,259 @@
+import uuid
+import shutil
+import tempfile
+import numpy as np
+import geopandas as gpd
+import concurrent.futures
+from osgeo import gdal, osr
+from math import ceil
+from os.path import join, abspath, basename, splitext
+from tqdm import tqdm
+from pgen.dem import get_dataset, clear_datasets, get_window
+from pgen.dem import get_stage_resources, set_gdal_resources
+from pgen.profile import sample_transect, sample_raster
+from pgen.executor import get_executor
+
+import sys
+IS_GUI = "--gui" in sys.argv
+
+# name of the VRT with one band per epoch
+STACK_NAME = "stack.vrt"
+
+# pixels read around the transect (neighbourhood of the cubic sampling)
+STACK_PAD = 2
+
+# tolerance of the origin offsets of the epochs (pixels), see get_stack
+GRID_TOLERANCE = 1e-6
+
+
+def is_same_crs(projection, other):
+    """Equal CRS of two WKT projections (DEMs without CRS only match each other)"""
+    if not projection or not other:
+        return projection == other
+    return bool(
+        osr.SpatialReference(wkt=projection).IsSame(osr.SpatialReference(wkt=other))
+    )
+
+
+def get_stack(epochs, stack_path="/vsimem"):
+    """VRT with one band per epoch on the same grid (in memory by default)
+
+    epochs: DEM file (or list of DEM tiles) of every epoch, or a single VRT
+    (multi-band raster) already stacked.
+    """
+    if isinstance(epochs, str):
+        return epochs
+
+    sources = []
+    for idx, files in enumerate(epochs):
+        files = [files] if isinstance(files, str) else files
+        if len(files) == 1:
+            sources.append(abspath(files[0]))
+            continue
+        # tiles of the epoch are stacked as a single mosaic
+        mosaic_file = join(stack_path, f"epoch_{idx}.vrt")
+        mosaic = gdal.BuildVRT(mosaic_file, [abspath(file) for file in files])
+        mosaic = None  # Close (write) the VRT
+        sources.append(mosaic_file)
+
+    # all bands are read with the window of the first one: the epochs must
+    # share the CRS, the pixel size and the pixel grid (origins whole pixels apart)
+    grids = []
+    for source in sources:
+        dem_input = gdal.Open(source, gdal.GA_ReadOnly)
+        grids.append((source, dem_input.GetGeoTransform(), dem_input.GetProjection()))
+        dem_input = None  # Close the dataset
+
+    first_source, first_geotransform, first_projection = grids[0]
+    for source, geotransform, projection in grids[1:]:
+        if not is_same_crs(first_projection, projection):
+            raise Exception(
+                f"... DEMs of the epochs have different CRS ({first_source}, {source})."
+            )
+        if (geotransform[1], geotransform[5]) != (
+            first_geotransform[1],
+            first_geotransform[5],
+        ):
+            raise Exception(
+                f"... DEMs of the epochs are not on the same grid (pixel sizes "
+                f"{(first_geotransform[1], first_geotransform[5])}, "
+                f"{(geotransform[1], geotransform[5])} of {source})."
+            )
+        offsets = (
+            (geotransform[0] - first_geotransform[0]) / first_geotransform[1],
+            (geotransform[3] - first_geotransform[3]) / first_geotransform[5],
+        )
+        if any(abs(offset - round(offset)) > GRID_TOLERANCE for offset in offsets):
+            raise Exception(
+                f"... DEMs of the epochs are not on the same grid (origin of {source} "
+                f"is {offsets} pixels from the origin of {first_source})."
+            )
+
+    stack_file = join(stack_path, STACK_NAME)
+    stack = gdal.BuildVRT(stack_file, sources, separate=True)
+    stack = None  # Close (write) the VRT
+    return stack_file
+
+
+def sample_stack_transects(stack_file, transects, resolution, sampling_method):
+    """Sample a chunk of transects (index, line) of all epochs of the stack
+
+    The window around every transect is read once for all epochs (bands).
+    Returns (index, distances, x, y, elevation [epoch x sample]) of every transect,
+    nodata samples are NaN.
+    """
+    stack = get_dataset(stack_file)
+    geotransform = stack.GetGeoTransform()
+    nodata = [
+        stack.GetRasterBand(band).GetNoDataValue()
+        for band in range(1, stack.RasterCount + 1)
+    ]
+    pad = STACK_PAD * max(abs(geotransform[1]), abs(geotransform[5]))
+
+    results = []
+    for transect_idx, line in transects:
+        dist, x_geo, y_geo = sample_transect(line, round(line.length, 2), resolution)
+        elevation = np.full((stack.RasterCount, len(dist)), np.nan)
+
+        minx, miny, maxx, maxy = line.bounds
+        window = get_window(
+            geotransform,
+            stack.RasterXSize,
+            stack.RasterYSize,
+            (minx - pad, miny - pad, maxx + pad, maxy + pad),
+        )
+        if window is not None:
+            xoff, yoff, xsize, ysize = window
+            arrays = stack.ReadAsArray(xoff, yoff, xsize, ysize).reshape(
+                stack.RasterCount, ysize, xsize
+            )
+            window_geotransform = (
+                geotransform[0] + xoff * geotransform[1],
+                geotransform[1],
+                0,
+                geotransform[3] + yoff * geotransform[5],
+                0,
+                geotransform[5],
+            )
+            for band, array in enumerate(arrays):
+                values = sample_raster(
+                    array, x_geo, y_geo, window_geotransform, nodata[band], sampling_method
+                )
+                if nodata[band] is not None:
+                    values[values == nodata[band]] = np.nan
+                elevation[band] = values
+
+        results.append((transect_idx, dist, x_geo, y_geo, elevation))
+    return results
+
+
+def sample_stack(
+    epochs,
+    db,
+    transects_layer="transects",
+    resolution=1,
+    sampling_method="nearest",
+    backend="thread",
+    resources=None,
+    names=None,
+):
+    """Profiles of all epochs sampled in a single pass over the transects
+
+    Sample positions of every transect are computed once and the elevations of
+    all epochs are read in one windowed read of the stack (see get_stack), so
+    the profiles of the epochs are aligned sample by sample. Returns arrays:
+    elevation [transect x epoch x sample] (NaN for nodata and beyond the end
+    of shorter transects), distance, x_geo, y_geo [transect x sample] (in the
+    CRS of the stack), no_transect and the epoch names (names of the DEMs by
+    default).
+    """
+    stack_path = None
+    try:
+        # workers of the process pool cannot read the in-memory VRT, every call
+        # has its own folder (stacks sampled at the same time in one process)
+        stack_path = (
+            tempfile.mkdtemp()
+            if backend == "process"
+            else f"/vsimem/stack_{uuid.uuid4().hex}"
+        )
+        stack_file = get_stack(epochs, stack_path)
+        stack = gdal.Open(stack_file, gdal.GA_ReadOnly)
+        epochs_count = stack.RasterCount
+        projection = stack.GetProjection()
+        stack = None  # Close the dataset
+
+        # transects in the CRS of the stack
+        transects = gpd.read_file(db, layer=transects_layer)
+        if projection:
+            transects = transects.to_crs(projection)
+        transect_lines = list(enumerate(np.asarray(transects.geometry)))
+        names = names or (
+            [
+                splitext(basename(files if isinstance(files, str) else files[0]))[0]
+                for files in epochs
+            ]
+            if not isinstance(epochs, str)
+            else [f"band_{band}" for band in range(1, epochs_count + 1)]
+        )
+
+        # CPU and memory budget of the workers and GDAL
+        resources = get_stage_resources(resources or {}, len(transect_lines), backend)
+        chunk_size = max(ceil(len(transect_lines) / (resources["workers"] * 4)), 1)
+
+        results = []
+        with get_executor(
+            backend,
+            resources["workers"],
+            initializer=set_gdal_resources,
+            initargs=(resources["gdal_threads"], resources["gdal_cachemax"]),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    sample_stack_transects,
+                    stack_file,
+                    transect_lines[i : i + chunk_size],
+                    resolution,
+                    sampling_method,
+                )
+                for i in range(0, len(transect_lines), chunk_size)
+            ]
+            with tqdm(
+                total=len(transect_lines), desc="... epochs stack", disable=IS_GUI
+            ) as progress:
+                for future in concurrent.futures.as_completed(futures):
+                    chunk = future.result()
+                    results.extend(chunk)
+                    progress.update(len(chunk))
+        results.sort(key=lambda result: result[0])
+
+        samples = max((len(result[1]) for result in results), default=0)
+        elevation = np.full((len(results), epochs_count, samples), np.nan)
+        distance = np.full((len(results), samples), np.nan)
+        x_geo = np.full((len(results), samples), np.nan)
+        y_geo = np.full((len(results), samples), np.nan)
+        for row, (_, dist, x, y, values) in enumerate(results):
+            elevation[row, :, : len(dist)] = values
+            distance[row, : len(dist)] = dist
+            x_geo[row, : len(dist)] = x
+            y_geo[row, : len(dist)] = y
+
+        return {
+            "elevation": elevation,
+            "distance": distance,
+            "x_geo": x_geo,
+            "y_geo": y_geo,
+            "no_transect": np.array([result[0] + 1 for result in results]),
+            "epochs": np.array(names),
+        }
+
+    except Exception as e:
+        print("... sample_stack function error")
+        raise e
+
+    finally:
+        clear_datasets()
+        if stack_path is not None and stack_path.startswith("/vsimem/"):
+            for name in gdal.ReadDir(stack_path) or []:
+                gdal.Unlink(join(stack_path, name))
+        elif stack_path is not None:
+            shutil.rmtree(stack_path, ignore_errors=True)
@@ -1,9 +1,8 @@
-import math
-import fiona
-import pandas as pd
+import numpy as np
 import geopandas as gpd
-from shapely.geometry import Point, LineString, shape, mapping
+import shapely
 import pgen.config as config
+from pgen.cache import get_cache_key, cache_lock, read_cached, write_cached
 
 
 def generate_transects(cfg, show_progress=True):
@@ -15,12 +14,13 @@ def generate_transects(cfg, show_progress=True):
         transects_layer,
         transect_distance,
         transect_length,
+        transect_cache,
     ) = config.parse(cfg, generate_transects.__name__)
 
     try:
         if not should_generate_transects(db, transects_layer):
             print("... transects already loaded from SHP file")
-            points_no = update_points(
+            update_points(
                 db,
                 crs,
                 line_layer,
@@ -29,74 +29,65 @@ def generate_transects(cfg, show_progress=True):
             )
             return
 
-        # generate points on the line (new layer of points in the base, fixed distances between points)
-        points_no = line_to_points(
-            db,
-            line_layer,
-            points_layer,
-            crs,
-            transect_distance,
-        )
-        points = gpd.read_file(db, layer=points_layer)
-        points.set_crs(crs, inplace=True, allow_override=True)
-
-        transects_tmp = pd.DataFrame()
-
-        i = 0
-        while i < points_no:
-            distance = points.loc[i]["distance"]
-            pt1 = points.iloc[[i - 1]]
-            pt1x, pt1y = pt1.centroid.x, pt1.centroid.y
-
-            if i == points_no - 1:
-                pt2 = points.iloc[[i]]
-            else:
-                pt2 = points.iloc[[i + 1]]
-            pt2x, pt2y = pt2.centroid.x, pt2.centroid.y
-
-            pt_mid = points.iloc[[i]]
-            pt_mid_x, pt_mid_y = pt_mid.centroid.x, pt_mid.centroid.y
-
-            if i == 0:
-                angle = get_angle(
-                    float(pt_mid_x.iloc[0]),
-                    float(pt_mid_y.iloc[0]),
-                    float(pt2x.iloc[0]),
-                    float(pt2y.iloc[0]),
-                )
-            else:
-                angle = get_angle(
-                    float(pt1x.iloc[0]),
-                    float(pt1y.iloc[0]),
-                    float(pt2x.iloc[0]),
-                    float(pt2y.iloc[0]),
-                )
-
-            start = get_point(pt_mid_x, pt_mid_y, angle, -transect_length / 2)
-            end = get_point(start.centroid.x, start.centroid.y, angle, transect_length)
-
-            transects_tmp = pd.concat(
-                [
-                    transects_tmp,
-                    pd.DataFrame(
-                        {
-                            "distance": [distance],
-                            "id": [i],
-                            "geometry": LineString([start, end]),
-                        }
-                    ),
-                ],
-                ignore_index=True,
-            )
-            i += 1
-
-        transects = gpd.GeoDataFrame(transects_tmp, crs=crs, geometry="geometry")
+        line = gpd.read_file(db, layer=line_layer).geometry.iloc[0]
+        if transect_cache is None:
+            points, transects = get_transects(line, crs, transect_distance, transect_length)
+        else:
+            # transects of the same coastline and parameters are shared by the surveys
+            key = get_cache_key([line], crs, transect_distance, transect_length)
+            with cache_lock(transect_cache):
+                cached = read_cached(transect_cache, ["points", "transects"], key)
+                if cached is None:
+                    points, transects = get_transects(
+                        line, crs, transect_distance, transect_length
+                    )
+                    write_cached(
+                        transect_cache, {"points": points, "transects": transects}, key
+                    )
+                else:
+                    print("... transects loaded from the site cache")
+                    points, transects = cached
+
+        report_crossings(transects)
+        points.to_file(db, layer=points_layer, driver="GPKG")
         transects.to_file(db, layer=transects_layer, driver="GPKG")
     except Exception as e:
         print("... generate_transects function error")
         raise e
 
 
+def get_transects(line, crs, transect_distance, transect_length):
+    """Points on the line (fixed distances between them) and transects perpendicular to it"""
+    points = line_to_points(line, crs, transect_distance)
+
+    # bearing of every transect from the neighbouring points (the first
+    # and the last point use the point itself instead of the missing one)
+    x = shapely.get_x(points.geometry.values)
+    y = shapely.get_y(points.geometry.values)
+    x_prev = np.concatenate([x[:1], x[:-1]])
+    y_prev = np.concatenate([y[:1], y[:-1]])
+    x_next = np.concatenate([x[1:], x[-1:]])
+    y_next = np.concatenate([y[1:], y[-1:]])
+    bearing = np.arctan2(y_next - y_prev, x_next - x_prev) + np.pi / 2
+
+    # start and end points, perpendicular to the line
+    dx = np.cos(bearing) * transect_length
+    dy = np.sin(bearing) * transect_length
+    start = np.column_stack([x - dx / 2, y - dy / 2])
+    end = start + np.column_stack([dx, dy])
+
+    transects = gpd.GeoDataFrame(
+        {
+            "distance": points["distance"].values,
+            "id": points["id"].values,
+        },
+        geometry=shapely.linestrings(np.stack([start, end], axis=1)),
+        crs=crs,
+    )
+    transects["crossings"] = count_crossings(np.asarray(transects.geometry))
+    return points, transects
+
+
 def should_generate_transects(db, transects_layer):
     ret_val = True
     try:
@@ -113,50 +104,75 @@ def update_points(db, crs, line_layer, points_layer, transects_layer):
     transects = gpd.read_file(db, layer=transects_layer)
     line = gpd.read_file(db, layer=line_layer)
 
-    points = transects.geometry.map(lambda t: t.intersection(line.geometry.iloc[0]))
+    points = gpd.GeoSeries(
+        intersect_line(np.asarray(transects.geometry), line.geometry.iloc[0]),
+        index=transects.index,
+        crs=crs,
+        name="geometry",
+    )
     found_intersection = ~points.is_empty
     points = gpd.GeoDataFrame(points[found_intersection], crs=crs, geometry="geometry")
     points.to_file(db, layer=points_layer, driver="GPKG")
 
-    transects = transects[found_intersection]
+    transects = transects[found_intersection].copy()
+    transects["crossings"] = count_crossings(np.asarray(transects.geometry))
+    report_crossings(transects)
     transects.to_file(db, layer=transects_layer, driver="GPKG")
 
 
-def line_to_points(db, line_layer_name, points_layer_name, points_layer_crs, step):
-    line_layer = fiona.open(db, layer=line_layer_name)
-    line = list(line_layer)[0]
-    line_layer.close()
-
-    geometry = shape(line["geometry"])
-    schema = {
-        "geometry": "Point",
-        "properties": {"id": "int", "distance": "float:13.2"},
-    }
-    with fiona.open(
-        db,
-        "w",
-        layer=points_layer_name,
-        driver="GPKG",
-        schema=schema,
-        OVERWRITE=1,
-        crs=points_layer_crs,
-    ) as output:
-        for i, distance in enumerate(range(0, int(geometry.length), step)):
-            point = geometry.interpolate(distance)
-            output.write(
-                {
-                    "geometry": mapping(point),
-                    "properties": {"id": i, "distance": distance},
-                }
-            )
-        output.close()
-    return i + 1  # geometry.length / step
-
-
-def get_angle(pt1x, pt1y, pt2x, pt2y):
-    return math.degrees(math.atan2(pt2y - pt1y, pt2x - pt1x))
+def get_segments(line):
+    """Segments (two-point lines) of all parts of the line"""
+    coords, part = shapely.get_coordinates(shapely.get_parts(line), return_index=True)
+    same_part = part[:-1] == part[1:]
+    return shapely.linestrings(
+        np.stack([coords[:-1][same_part], coords[1:][same_part]], axis=1)
+    )
+
+
+def intersect_line(transects, line):
+    """Intersections of the transects with the line (empty if none)
+
+    Only the line segments found by the STRtree query are intersected.
+    """
+    segments = get_segments(line)
+    transect_idx, segment_idx = shapely.STRtree(segments).query(
+        transects, predicate="intersects"
+    )
+    intersections = shapely.intersection(
+        transects[transect_idx], segments[segment_idx]
+    )
+
+    points = np.array([shapely.Point()] * len(transects), dtype=object)
+    found, first, count = np.unique(
+        transect_idx, return_index=True, return_counts=True
+    )
+    points[found[count == 1]] = intersections[first[count == 1]]
+    for idx in found[count > 1]:
+        # more than one segment (e.g. crossing at a vertex or a curved coast)
+        points[idx] = shapely.union_all(intersections[transect_idx == idx])
+    return points
+
+
+def count_crossings(transects):
+    """Number of other transects crossed by every transect (STRtree query)"""
+    crossing_idx, _ = shapely.STRtree(transects).query(transects, predicate="crosses")
+    return np.bincount(crossing_idx, minlength=len(transects))
+
+
+def report_crossings(transects):
+    crossing = transects[transects.crossings > 0]
+    if len(crossing) > 0:
+        print(
+            f"... {len(crossing)} transects cross other transects "
+            f"(see the crossings column of the transects layer)"
+        )
 
 
-def get_point(pt1x, pt1y, bearing, dist):
-    bearing = math.radians(bearing + 90)
-    return Point(pt1x + dist * math.cos(bearing), pt1y + dist * math.sin(bearing))
+def line_to_points(line, points_layer_crs, step):
+    distance = np.arange(0, int(line.length), step)
+    points = gpd.GeoDataFrame(
+        {"id": np.arange(len(distance)), "distance": distance.round(2)},
+        geometry=shapely.line_interpolate_point(line, distance),
+        crs=points_layer_crs,
+    )
+    return points
@@ -0,0 +1,7 @@
+from shapely.geometry import LineString
+
+
+def create_line_from_points(points_gdf):
+    """Line through the points of a layer in profile (and point) order"""
+    points_sorted = points_gdf.sort_values(by=["profile_id", "point_id"])
+    return LineString(points_sorted.geometry.tolist())
@@ -0,0 +1,65 @@
+import glob
+import hashlib
+import json
+import os
+from os.path import join, exists, isdir, isfile
+
+# manifest of the survey (base folder) shared by the tools: hash of the inputs
+# of every finished stage
+MANIFEST_FILE = "manifest.json"
+
+
+def get_files_state(paths):
+    """Names, sizes and modification times of the files (recursively in folders)"""
+    state = []
+    for path in paths:
+        files = (
+            sorted(glob.glob(join(path, "**", "*"), recursive=True))
+            if isdir(path)
+            else [path]
+        )
+        for file in files:
+            if isfile(file):
+                stat = os.stat(file)
+                state.append([file, stat.st_size, stat.st_mtime_ns])
+    return state
+
+
+def get_hash(*items):
+    return hashlib.sha256(
+        json.dumps(items, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def read_manifest(base):
+    manifest_file = join(base, MANIFEST_FILE)
+    if not exists(manifest_file):
+        return {}
+    with open(manifest_file, "r") as jsonfile:
+        return json.load(jsonfile)
+
+
+def write_manifest(base, manifest):
+    with open(join(base, MANIFEST_FILE), "w") as jsonfile:
+        json.dump(manifest, jsonfile, indent=4)
+
+
+def get_stage_hash(config, input_paths):
+    """Hash of the stage inputs (the whole config and the input files)"""
+    return get_hash(config, get_files_state(input_paths))
+
+
+def is_up_to_date(config, stage, stage_hash, output_paths):
+    """Stage finished with the same inputs and its outputs still exist"""
+    manifest = read_manifest(config["paths"]["base"])
+    return manifest.get(stage) == stage_hash and all(
+        exists(path) for path in output_paths
+    )
+
+
+def update_manifest(config, stage, stage_hash):
+    """Record the inputs hash of the finished stage"""
+    base = config["paths"]["base"]
+    manifest = read_manifest(base)
+    manifest[stage] = stage_hash
+    write_manifest(base, manifest)
@@ -0,0 +1,16 @@
+import os
+
+
+def get_cpus():
+    """CPUs available to the process (affinity mask, e.g. of a batch job)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_memory():
+    """Physical memory of the machine (MB)"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**20
+    except (AttributeError, ValueError, OSError):
+        return 4096
@@ -0,0 +1,65 @@
+import re
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from os.path import exists, basename
+
+# columnar (Parquet) profile store, hive-partitioned by survey and DEM file name,
+# each partition sorted by transect and point number
+PARTITION_COLS = ["survey", "dem"]
+SORT_COLS = ["no_transect", "no_point"]
+
+
+def write_profiles(store_path, profiles, survey):
+    """Write profiles to the store, replacing the partitions of the survey DEMs"""
+    table = pa.Table.from_pandas(
+        profiles.assign(survey=survey).sort_values(PARTITION_COLS + SORT_COLS),
+        preserve_index=False,
+    )
+    pq.write_to_dataset(
+        table,
+        store_path,
+        partition_cols=PARTITION_COLS,
+        existing_data_behavior="delete_matching",
+    )
+
+
+def read_profiles(store_path, columns=None, survey=None, profile_ids=None):
+    """Read (selected columns of) profiles from the store, sorted by transect, DEM and point"""
+    if not exists(store_path):
+        raise Exception(f"... cannot find the profile store ({store_path}).")
+
+    filters = []
+    if survey is not None:
+        filters.append(("survey", "==", survey))
+    if profile_ids is not None:
+        filters.append(("no_transect", "in", list(profile_ids)))
+
+    if columns is not None:
+        columns = list(dict.fromkeys(columns + ["dem"] + SORT_COLS))
+    profiles = pd.read_parquet(store_path, columns=columns, filters=filters or None)
+
+    for key in PARTITION_COLS:
+        if key in profiles.columns:
+            profiles[key] = profiles[key].astype(str)
+    return profiles.sort_values(["no_transect", "dem", "no_point"], ignore_index=True)
+
+
+def iter_profiles(profiles):
+    """(profile_id, profile) pairs, one profile per transect and DEM, indexed by no_point"""
+    for (profile_id, _), profile in profiles.groupby(
+        ["no_transect", "dem"], sort=False
+    ):
+        yield int(profile_id), profile.reset_index(drop=True)
+
+
+def iter_csv_profiles(profile_files, sep, profile_ids=None):
+    """(profile_id, profile) pairs of the profile CSV files"""
+    for name in profile_files:
+        # get profile number from file name
+        profile_id = int(re.findall(r"\d{1,4}", basename(name))[0])
+        if profile_ids is not None and profile_id not in profile_ids:
+            continue
+        yield profile_id, pd.read_csv(
+            name, encoding="utf-8", sep=sep, skipinitialspace=True
+        )
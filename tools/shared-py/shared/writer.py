@@ -0,0 +1,64 @@
+import queue
+import threading
+
+# write tasks waiting for the writer threads
+WRITER_QUEUE_SIZE = 64
+
+
+class AsyncWriter:
+    """Background writer threads fed through a bounded queue
+
+    submit() blocks when the queue is full (backpressure), flush() is a barrier
+    waiting for all submitted writes, it raises the first error of the writes.
+    With a single thread writes are done in the order of submission.
+    """
+
+    def __init__(self, threads=1, maxsize=WRITER_QUEUE_SIZE):
+        self.tasks = queue.Queue(maxsize)
+        self.errors = []
+        self.threads = [
+            threading.Thread(target=self.run, daemon=True) for _ in range(threads)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def run(self):
+        while (task := self.tasks.get()) is not None:
+            fn, args, kwargs = task
+            try:
+                if not self.errors:  # skip writes after the first error
+                    fn(*args, **kwargs)
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                self.tasks.task_done()
+        self.tasks.task_done()
+
+    def submit(self, fn, *args, **kwargs):
+        self.tasks.put((fn, args, kwargs))
+
+    def flush(self):
+        self.tasks.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for _ in self.threads:
+                self.tasks.put(None)
+            for thread in self.threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # stop without raising errors of the writes over the original one
+        self.errors.append(exc_value)
+        for _ in self.threads:
+            self.tasks.put(None)